@@ -0,0 +1,254 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter
+from types import SimpleNamespace
+
+from PIL import Image
+
+from model import FileModel, ImageBoxModel, LayerModel, NoteModel, SceneModel, TextboxModel
+
+WORDS = ("the hero walks into the castle at night and finds the map hidden under a broken "
+         "lantern while rain falls over the quiet harbour").split()
+
+
+def generate_images(directory, count, size=(1600, 1200)):
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"image_{index}.png")
+        image = Image.new("RGB", size, ((index * 40) % 256, (index * 90) % 256, (index * 150) % 256))
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def generate_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_app_state(files, acts, elements, image_paths=(), image_ratio=0.1, seed=0):
+    rng = random.Random(seed)
+    file_dicts = []
+    for file_index in range(files):
+        layers = []
+        for act_index in range(acts):
+            models = []
+            for element_index in range(elements):
+                x, y = rng.randint(0, 4000), rng.randint(0, 3000)
+                if image_paths and rng.random() < image_ratio:
+                    models.append(ImageBoxModel(x, y, 262, 196, 200, rng.choice(image_paths)))
+                    continue
+                kind = element_index % 3
+                if kind == 0:
+                    models.append(NoteModel(x, y, content=generate_text(rng, 40)))
+                elif kind == 1:
+                    models.append(TextboxModel(x, y, content=generate_text(rng, 15)))
+                else:
+                    models.append(SceneModel(x, y, f"Scene {element_index}", generate_text(rng, 60)))
+            layers.append(LayerModel(f"Act {act_index + 1}", models))
+        file_dicts.append(FileModel(f"Storyboard_{file_index}", layers=layers).to_dict())
+    return {"files": file_dicts}
+
+
+def measure(name, action, rounds, setup=None):
+    timings = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        action()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "name": name,
+        "stats": {
+            "rounds": rounds,
+            "min": min(timings),
+            "max": max(timings),
+            "mean": statistics.mean(timings),
+            "median": statistics.median(timings),
+            "stddev": statistics.stdev(timings) if rounds > 1 else 0.0,
+            "total": sum(timings),
+        },
+    }
+
+
+def commit_id():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def storage_benchmarks(app_state, directory, rounds):
+    import pickle
+    from main import load_app_state, save_app_state
+    from storage import JOURNAL_PATH, STATE_PATH, write_atomic
+    from storage import load_layers
+    from stateformat import load_legacy
+
+    file_path = os.path.join(directory, STATE_PATH)
+    journal_path = os.path.join(directory, JOURNAL_PATH)
+    legacy_path = os.path.join(directory, "legacy_state.pkl")
+
+    def load_and_open():
+        loaded = load_app_state(file_path, journal_path, legacy_path=None)
+        load_layers(loaded["files"][0])
+
+    def save_loaded():
+        # Autosave and compaction: only files decoded since load are encoded again.
+        save_app_state(loaded, file_path)
+
+    results = [
+        measure("save_app_state", lambda: save_app_state(app_state, file_path), rounds),
+        measure("load_app_state", lambda: load_app_state(file_path, journal_path, legacy_path=None), rounds),
+        measure("load_app_state + open one file", load_and_open, rounds),
+    ]
+    loaded = load_app_state(file_path, journal_path, legacy_path=None)
+    load_layers(loaded["files"][0])
+    return results + [
+        measure("save_app_state after opening one file", save_loaded, rounds),
+        measure("save legacy pickle", lambda: write_atomic(legacy_path, pickle.dumps(app_state)), rounds),
+        measure("load legacy pickle", lambda: load_legacy(legacy_path), rounds),
+    ]
+
+
+def gui_benchmarks(app_state, rounds, steps):
+    from customtkinter import CTk
+    from elements import ImageBox, create_element
+    from pages import PageController
+    from search import SearchIndex
+
+    class BenchmarkHost(CTk):
+        def __init__(self):
+            super().__init__()
+            self.geometry("1280x800")
+            self.search_index = SearchIndex()
+            self.recorded = 0
+
+        def record_ops(self, ops):
+            self.recorded += len(ops)
+
+        def save_state(self, event=None):
+            pass
+
+    host = BenchmarkHost()
+    results = []
+    try:
+        controller = PageController(host, host, app_state=app_state)
+        results.append(measure("PageController.load_files", controller.load_files, rounds))
+
+        file_name = app_state["files"][0]["file_name"]
+        controller.show_page(file_name)
+        page = controller.pages[file_name]
+        host.update()
+
+        def mark_everything():
+            for layer_model in page.model.layers:
+                for element_model in layer_model.elements:
+                    page.changes.mark(layer_model, element_model)
+
+        results.append(measure("File.save_file_state (all elements dirty)", page.save_file_state, rounds,
+                               setup=mark_everything))
+
+        layer = page.layers[page.current_layer_index]
+        first = layer.model.elements[0]
+        results.append(measure("File.save_file_state (one element dirty)", page.save_file_state, rounds,
+                               setup=lambda: layer.mark_dirty(first)))
+
+        def drag():
+            layer.is_dragging = True
+            layer.drag_start_position = {"x": 0, "y": 0}
+            for step in range(1, steps + 1):
+                layer.do_drag(SimpleNamespace(x_root=step * 3, y_root=step * 2))
+                host.update_idletasks()
+            layer.is_dragging = False
+
+        results.append(measure(f"Layer.do_drag ({steps} events)", drag, rounds))
+
+        image_model = next((model for model in layer.model.elements if isinstance(model, ImageBoxModel)), None)
+        image_box = next((element for element in layer.elements if isinstance(element, ImageBox)), None)
+        if image_box is None and image_model is not None:
+            image_box = create_element(layer, image_model)
+            layer.mount_element(image_box)
+
+        if image_box is not None:
+            host.update_idletasks()
+
+            def resize(handler):
+                def run():
+                    image_box.start_resizing(SimpleNamespace(x_root=0, y_root=0))
+                    for step in range(1, steps + 1):
+                        handler(SimpleNamespace(x_root=step * 2, y_root=step * 2))
+                        host.update_idletasks()
+                    image_box.stop_resizing(SimpleNamespace(x_root=0, y_root=0))
+                return run
+
+            for handler in (image_box.resize_frame_se, image_box.resize_frame_width_right,
+                            image_box.resize_frame_height_bottom):
+                results.append(measure(f"ImageBox.{handler.__name__} ({steps} events)", resize(handler), rounds))
+    finally:
+        host.destroy()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time load, save, drag and resize paths on synthetic storyboards. "
+                    "GUI benchmarks need a display; run headless with `xvfb-run python benchmark.py`.")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--acts", type=int, default=3)
+    parser.add_argument("--elements", type=int, default=100)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=60)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--no-gui", action="store_true", help="only run the storage benchmarks")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    # Icons are loaded relative to the repository root.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        image_paths = generate_images(directory, args.images)
+        app_state = generate_app_state(args.files, args.acts, args.elements, image_paths)
+
+        benchmarks = storage_benchmarks(app_state, directory, args.rounds)
+        if not args.no_gui:
+            try:
+                benchmarks.extend(gui_benchmarks(app_state, args.rounds, args.steps))
+            except tkinter.TclError as error:
+                print(f"Skipping GUI benchmarks: {error}", file=sys.stderr)
+
+    results = {
+        "datetime": datetime.datetime.now().isoformat(),
+        "commit": commit_id(),
+        "machine_info": {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+        },
+        "params": vars(args),
+        "benchmarks": benchmarks,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for benchmark in benchmarks:
+        stats = benchmark["stats"]
+        print(f"{benchmark['name']:<55} median {stats['median'] * 1000:9.2f} ms  min {stats['min'] * 1000:9.2f} ms")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
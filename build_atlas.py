@@ -0,0 +1,42 @@
+import json
+import math
+import os
+
+from PIL import Image
+
+from functions import ATLAS_IMAGE, ATLAS_INDEX, ICON_DIR
+
+# Icons are shown at 30 px at most; 64 px cells stay sharp up to 200% scaling.
+CELL_SIZE = 64
+
+
+def icon_names(directory=ICON_DIR):
+    skipped = {os.path.basename(ATLAS_IMAGE)}
+    return sorted(name for name in os.listdir(directory) if name.endswith(".png") and name not in skipped)
+
+
+def build_atlas(directory=ICON_DIR, cell_size=CELL_SIZE):
+    names = icon_names(directory)
+    columns = max(math.ceil(math.sqrt(len(names))), 1)
+    rows = max(math.ceil(len(names) / columns), 1)
+    sheet = Image.new("RGBA", (columns * cell_size, rows * cell_size), (0, 0, 0, 0))
+
+    boxes = {}
+    for index, name in enumerate(names):
+        with Image.open(os.path.join(directory, name)) as source:
+            icon = source.convert("RGBA")
+        icon.thumbnail((cell_size, cell_size), Image.Resampling.LANCZOS)
+        x = (index % columns) * cell_size
+        y = (index // columns) * cell_size
+        sheet.paste(icon, (x, y))
+        boxes[name] = [x, y, icon.width, icon.height]
+
+    sheet.save(ATLAS_IMAGE, optimize=True)
+    with open(ATLAS_INDEX, "w", encoding="utf-8") as f:
+        json.dump(boxes, f, indent=2)
+    return boxes
+
+
+if __name__ == "__main__":
+    boxes = build_atlas()
+    print(f"Packed {len(boxes)} icons into {ATLAS_IMAGE}")
@@ -0,0 +1,306 @@
+import os
+import tkinter
+
+from PIL import ImageTk
+
+from events import MotionCoalescer
+from functions import get_color
+from imaging import exists, image_cache, image_loader, render_from_pyramid
+from model import ImageBoxModel, NoteModel, SceneModel, TextboxModel
+
+RENDER_MODE = os.environ.get("KOUAN_RENDER", "widgets")
+
+TEXT_PADDING = 8
+
+FULL_DETAIL_ZOOM = 0.6
+TITLE_DETAIL_ZOOM = 0.3
+
+
+def fit_text(text, width, height, font_size):
+    # Canvas text is not clipped, so never lay out more than the box can show.
+    columns = max(int(width / (font_size * 0.6)), 1)
+    rows = max(int(height / (font_size * 1.4)), 1)
+    limit = columns * rows
+    if len(text) > limit:
+        return text[:max(limit - 3, 0)] + "..."
+    return text
+
+
+def detail_level(zoom):
+    if zoom >= FULL_DETAIL_ZOOM:
+        return "full"
+    if zoom >= TITLE_DETAIL_ZOOM:
+        return "titles"
+    return "boxes"
+
+
+def first_line(text):
+    return text.split("\n", 1)[0][:80]
+
+
+class CanvasRenderer:
+    def __init__(self, layer):
+        self.layer = layer
+        self.scaling = layer._get_widget_scaling()
+
+        background = layer._apply_appearance_mode(layer._fg_color)
+        self.canvas = tkinter.Canvas(layer, highlightthickness=0, bd=0, bg=background)
+        self.canvas.place(x=0, y=0, relwidth=1, relheight=1)
+
+        self.models = {}
+        self.images = {}
+        self.thumbnails = {}
+        self.loading = set()
+        self.selected = None
+        self.editing = None
+        self._drag_start = (0, 0)
+        self.pressed = None
+
+        self.canvas.tag_bind("element", "<Button-1>", self.on_press)
+        self.item_motion = MotionCoalescer(self.canvas, self.on_drag)
+        self.canvas.tag_bind("element", "<B1-Motion>", self.item_motion)
+        self.canvas.tag_bind("element", "<ButtonRelease-1>", self.on_release)
+        self.canvas.tag_bind("element", "<Double-Button-1>", self.on_double_click)
+
+        self.canvas.bind("<Button-1>", self.on_background_press, add="+")
+        self.canvas.bind("<B1-Motion>", self.on_background_drag, add="+")
+        self.canvas.bind("<ButtonRelease-1>", self.on_background_release, add="+")
+        self.canvas.bind("<Delete>", self.on_delete)
+        for sequence in ("<Control-MouseWheel>", "<Control-Button-4>", "<Control-Button-5>"):
+            self.canvas.bind(sequence, layer.on_zoom_wheel)
+
+    def lower_below(self, widget):
+        tkinter.Misc.lower(self.canvas, widget)
+
+    @property
+    def zoom(self):
+        return self.layer.model.zoom
+
+    def destroy(self):
+        self.canvas.destroy()
+        self.clear()
+
+    def clear(self):
+        self.canvas.delete("element")
+        self.models.clear()
+        self.images.clear()
+        self.thumbnails.clear()
+
+    def tag(self, model):
+        return f"e{model.id}"
+
+    def model_at(self, event):
+        # The layer's spatial index answers hit tests; the model in edit is a widget, not a canvas item.
+        x, y = self.layer.model.to_world(event.x / self.scaling, event.y / self.scaling)
+        model = self.layer.element_at(x, y)
+        if model is None or self.tag(model) not in self.models:
+            return None
+        return model
+
+    def sync(self, visible):
+        for model in list(self.models.values()):
+            if model not in visible and model is not self.selected:
+                self.remove(model)
+
+        editing = self.editing.model if self.editing is not None else None
+        for model in self.layer.index.in_order(visible):
+            if model is not editing and self.tag(model) not in self.models:
+                self.draw(model)
+
+    def draw(self, model):
+        tag = self.tag(model)
+        self.canvas.delete(tag)
+        self.models[tag] = model
+
+        x, y = self.layer.model.to_screen(model.x, model.y)
+        x, y = x * self.scaling, y * self.scaling
+        scale = self.scaling * self.zoom
+        width, height = model.width * scale, model.height * scale
+        tags = ("element", tag)
+        outline = get_color() if model is self.selected else ""
+        detail = detail_level(self.zoom)
+
+        if isinstance(model, NoteModel):
+            self.canvas.create_rectangle(x, y, x + width, y + height, fill=model.color,
+                                         outline=outline, width=2, tags=tags)
+            if detail == "full":
+                self.draw_text(x, y, width, height, model.content, 12, "black", tags)
+            elif detail == "titles":
+                self.draw_text(x, y, width, height, first_line(model.content), 12, "black", tags)
+        elif isinstance(model, TextboxModel):
+            self.canvas.create_rectangle(x, y, x + width, y + height, fill="",
+                                         outline=outline or "grey", width=2, tags=tags)
+            if detail == "full":
+                self.draw_text(x, y, width, height, model.content, model.font_size, get_color(), tags)
+        elif isinstance(model, SceneModel):
+            title_height = 30 * scale
+            self.canvas.create_rectangle(x, y, x + width, y + height, fill="#252525",
+                                         outline=outline, width=2, tags=tags)
+            if detail != "boxes":
+                self.draw_text(x, y, width, title_height, model.name, 16, "white", tags)
+            if detail == "full":
+                self.draw_text(x, y + title_height, width, height - title_height, model.content, 12, "white", tags)
+        elif isinstance(model, ImageBoxModel):
+            if detail == "full":
+                image = self.render_image(model, width, height)
+            else:
+                image = self.render_thumbnail(model, width, height)
+            if image is not None:
+                self.canvas.create_image(x, y, image=image, anchor="nw", tags=tags)
+                if outline:
+                    self.canvas.create_rectangle(x, y, x + width, y + height, outline=outline,
+                                                 width=2, tags=tags)
+            else:
+                self.canvas.create_rectangle(x, y, x + width, y + height, fill="dark grey",
+                                             outline=outline, width=2, tags=tags)
+
+    def draw_text(self, x, y, width, height, text, font_size, color, tags):
+        if not text:
+            return
+        padding = TEXT_PADDING * self.scaling * self.zoom
+        pixel_size = font_size * self.scaling * self.zoom
+        text = fit_text(text, width - 2 * padding, height - 2 * padding, pixel_size)
+        self.canvas.create_text(x + padding, y + padding, text=text, anchor="nw", width=max(width - 2 * padding, 1),
+                                fill=color, font=("Arial", -int(round(pixel_size))), tags=tags)
+
+    def load_pyramid(self, image_path, size, fast=False):
+        pyramid = image_cache.cached(image_path) if fast else image_cache.lookup(image_path, size)
+        if pyramid is None:
+            if image_path not in self.loading and os.path.exists(image_path):
+                self.loading.add(image_path)
+                image_loader.request(self.canvas, image_path, size,
+                                     lambda levels: self.image_loaded(image_path), render=False)
+            # Until the decode lands, any cached resolution beats an empty box.
+            pyramid = image_cache.cached(image_path)
+        return pyramid
+
+    def image_loaded(self, image_path):
+        self.loading.discard(image_path)
+        if not exists(self.canvas):
+            return
+        for model in list(self.models.values()):
+            if isinstance(model, ImageBoxModel) and model.image_path == image_path:
+                tag = self.tag(model)
+                below = self.canvas.find_below(tag)
+                self.draw(model)
+                if below:
+                    self.canvas.tag_raise(tag, below)
+
+    def render_image(self, model, width, height):
+        pyramid = self.load_pyramid(model.image_path, (width, height))
+        if pyramid is None:
+            return None
+        image = self.images[model.id] = ImageTk.PhotoImage(render_from_pyramid(pyramid, (width, height)))
+        return image
+
+    def render_thumbnail(self, model, width, height):
+        key = (model.image_path, int(round(width)), int(round(height)))
+        image = self.thumbnails.get(key)
+        if image is None:
+            pyramid = self.load_pyramid(model.image_path, (width, height), fast=True)
+            if pyramid is None:
+                return None
+            image = self.thumbnails[key] = ImageTk.PhotoImage(
+                render_from_pyramid(pyramid, (width, height), fast=True))
+        return image
+
+    def select(self, model):
+        previous, self.selected = self.selected, model
+        if previous is not None and previous is not model and self.tag(previous) in self.models:
+            self.draw(previous)
+        if model is not None:
+            self.layer.index.raise_to_top(model)
+            self.draw(model)
+            self.canvas.tag_raise(self.tag(model))
+            self.canvas.focus_set()
+
+    def on_press(self, event):
+        model = self.model_at(event)
+        if model is None:
+            return
+        self.commit_edit()
+        self.select(model)
+        self._drag_start = (event.x, event.y)
+
+    def on_drag(self, event):
+        if self.selected is None or self.layer.is_dragging:
+            return
+        dx = event.x - self._drag_start[0]
+        dy = event.y - self._drag_start[1]
+        self._drag_start = (event.x, event.y)
+        self.canvas.move(self.tag(self.selected), dx, dy)
+        self.selected.x += dx / (self.scaling * self.zoom)
+        self.selected.y += dy / (self.scaling * self.zoom)
+
+    def on_release(self, event):
+        self.item_motion.flush()
+        if self.selected is not None:
+            self.layer.mark_dirty(self.selected)
+
+    def on_double_click(self, event):
+        model = self.model_at(event)
+        if model is not None:
+            self.edit(model)
+
+    def on_delete(self, event):
+        model = self.selected
+        if model is None:
+            return
+        self.selected = None
+        self.remove(model)
+        self.layer.remove_model(model)
+
+    def on_background_press(self, event):
+        self.pressed = self.model_at(event)
+        if self.pressed is not None:
+            return
+        self.commit_edit()
+        self.select(None)
+        self.layer.click(event)
+
+    def on_background_drag(self, event):
+        if self.pressed is None or self.layer.is_dragging:
+            self.layer.drag_motion(event)
+
+    def on_background_release(self, event):
+        self.layer.stop_drag(event)
+
+    def remove(self, model):
+        tag = self.tag(model)
+        self.canvas.delete(tag)
+        self.models.pop(tag, None)
+        self.images.pop(model.id, None)
+
+    def pan(self, dx, dy):
+        self.canvas.move("element", dx * self.scaling, dy * self.scaling)
+
+    def edit(self, model):
+        from elements import create_element
+
+        self.commit_edit()
+        self.select(None)
+        element = create_element(self.layer, model)
+        if element is None:
+            return
+        self.remove(model)
+        self.layer.mount_element(element)
+        self.begin_edit(element)
+
+    def begin_edit(self, element):
+        if self.editing is not None and self.editing is not element:
+            self.commit_edit()
+        self.editing = element
+        self.layer.toolbar.lift()
+        element.select()
+
+    def commit_edit(self):
+        element, self.editing = self.editing, None
+        if element is None:
+            return
+        element.deselect()
+        element.flush_motion()
+        if element in self.layer.elements:
+            self.layer.elements.remove(element)
+        element.destroy()
+        if element.model in self.layer.model.elements:
+            self.draw(element.model)
@@ -0,0 +1,35 @@
+import argparse
+import os
+
+import stateformat
+from storage import LEGACY_STATE_PATH, STATE_PATH, write_atomic
+
+
+def convert(source, destination, compress=stateformat.COMPRESS):
+    app_state = stateformat.load_legacy(source)
+    data = stateformat.dumps(app_state, compress=compress)
+    # Refuse to hand back a file that does not read back to the same state.
+    if stateformat.loads(data, lazy=False) != app_state:
+        raise stateformat.FormatError(f"{source} does not survive conversion unchanged")
+    write_atomic(destination, data)
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pickled app_state.pkl into the .kst state format.")
+    parser.add_argument("source", nargs="?", default=LEGACY_STATE_PATH)
+    parser.add_argument("destination", nargs="?", default=STATE_PATH)
+    parser.add_argument("--no-compress", dest="compress", action="store_false", default=stateformat.COMPRESS,
+                        help="store file segments without zlib compression")
+    parser.add_argument("--force", action="store_true", help="overwrite an existing destination")
+    args = parser.parse_args()
+
+    if os.path.exists(args.destination) and not args.force:
+        parser.error(f"{args.destination} already exists; pass --force to overwrite it")
+
+    size = convert(args.source, args.destination, args.compress)
+    print(f"{args.source} ({os.path.getsize(args.source)} bytes) -> {args.destination} ({size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
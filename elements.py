@@ -3,8 +3,14 @@ from PIL import Image
 from functions import *
 from tkinter import colorchooser
 from abc import abstractmethod
+from model import *
+from imaging import image_cache, image_files, image_loader, render_from_pyramid
+from events import MotionCoalescer
+import instrumentation
+from instrumentation import timed
 
 font_size = 12
+PLACEHOLDER_COLOR = "dark grey"
 
 class Selectable:
     selected_object = None 
@@ -14,15 +20,14 @@ class Selectable:
         self.layer = layer
         self._drag_data = {"x": 0, "y": 0}
         self.is_selected = False
+        self.motions = []
 
         self.unselected_border_color = "gray"
 
         self.widget.bind("<Button-1>", self.on_click)
-        self.widget.bind("<B1-Motion>", self.do_drag)
+        self.widget.bind("<B1-Motion>", self.coalesce(self.do_drag))
         self.widget.bind("<ButtonRelease-1>", self.stop_drag)
 
-        self.layer.bind("<Button-1>", self.deselect)
-
         self.widget.bind("<Delete>", self.delete_if_selected)
 
     def on_click(self, event):
@@ -52,34 +57,50 @@ class Selectable:
         if isinstance(self, ImageBox):
                 self.hide_resizers()
 
-        self.layer.file_parent.save_file_state()
-
     def start_drag(self, event):
         self._drag_data["x"] = event.x
         self._drag_data["y"] = event.y
 
+    def world_scale(self):
+        # Screen pixels per world unit, matching Layer.place_element and CanvasRenderer.on_drag.
+        return self.widget._get_widget_scaling() * self.layer.model.zoom
+
+    @timed("Selectable.do_drag")
     def do_drag(self, event):
-        dx = event.x - self._drag_data["x"]
-        dy = event.y - self._drag_data["y"]
+        scale = self.world_scale()
+        self.model.x += (event.x - self._drag_data["x"]) / scale
+        self.model.y += (event.y - self._drag_data["y"]) / scale
+        self.layer.place_element(self.widget)
 
-        x = (self.widget.winfo_x() + dx) * 0.8
-        y = (self.widget.winfo_y() + dy) * 0.8
-        self.widget.place(x=x, y=y)
+    def coalesce(self, handler):
+        motion = MotionCoalescer(self.widget, handler)
+        self.motions.append(motion)
+        return motion
+
+    def flush_motion(self):
+        for motion in self.motions:
+            motion.flush()
 
     def stop_drag(self, event):
+        self.flush_motion()
         self._drag_data = {"x": 0, "y": 0}
-        self.layer.file_parent.save_file_state()
+        self.mark_dirty()
 
     def delete_if_selected(self, event):
         if Selectable.selected_object == self:
             self.deselect()
+            self.layer.remove_element(self)
             self.widget.destroy()
 
-        self.layer.file_parent.save_file_state()
+    def mark_dirty(self):
+        self.layer.mark_dirty(self.model)
+
+    def sync_content(self, event=None):
+        self.model.content = self.get_content()
+        self.mark_dirty()
 
-    @abstractmethod
     def to_dict(self):
-        pass
+        return self.model.to_dict()
 
     @abstractmethod
     def get_content(self):
@@ -102,12 +123,12 @@ class Toolbar(CTkFrame):
         tool = CTkFrame(self, width=50, height=350, corner_radius=50, fg_color="light grey")
         tool.pack(side=TOP)
         
-        iconcursor = CTkImage(Image.open("images\\cursor.png"), size=(20, 20))
-        iconhand = CTkImage(Image.open("images\\hand.png"), size=(30, 30))
-        icontext = CTkImage(Image.open("images\\Textbox.png"), size=(20, 20))
-        iconnote = CTkImage(Image.open("images\\Note.png"), size=(30, 30))
-        iconimage = CTkImage(Image.open("images\\Image.png"), size=(20, 20))
-        iconscene = CTkImage(Image.open("images\\Scene.png"), size=(20, 20))
+        iconcursor = load_icon("cursor.png", (20, 20))
+        iconhand = load_icon("hand.png", (30, 30))
+        icontext = load_icon("Textbox.png", (20, 20))
+        iconnote = load_icon("Note.png", (30, 30))
+        iconimage = load_icon("Image.png", (20, 20))
+        iconscene = load_icon("Scene.png", (20, 20))
         tools = []
 
         cursor = CTkButton(tool, image=iconcursor, text=None, text_color="black", width=50, height=50,
@@ -132,7 +153,7 @@ class Toolbar(CTkFrame):
 
         image = CTkButton(tool, image=iconimage, text=None, text_color="black", width=50, height=50,
                                   fg_color="transparent", corner_radius=0, hover_color= "dark grey",
-                                   command=self.add_image)
+                                   command=self.show_image_options)
         tools.append(image)
 
         scene = CTkButton(tool, image=iconscene, text=None, text_color="black", width=50, height=50,
@@ -146,8 +167,8 @@ class Toolbar(CTkFrame):
         self.note_option = CTkFrame(self.layer, width=50, height=100, corner_radius=50, border_width=None, bg_color="transparent",
                                 fg_color="light grey")
         
-        iconstandard = CTkImage(Image.open("images\\yellow.png"), size=(30, 30))
-        iconcolorwheel = CTkImage(Image.open("images\\colorwheel.png"), size=(30, 30))
+        iconstandard = load_icon("yellow.png", (30, 30))
+        iconcolorwheel = load_icon("colorwheel.png", (30, 30))
 
         standard = CTkButton(self.note_option, image=iconstandard, text=None, text_color="black", width=50, height=50,
                                   fg_color="transparent", corner_radius=0, hover_color= "dark grey", command=self.add_note)
@@ -157,10 +178,31 @@ class Toolbar(CTkFrame):
                                   fg_color="transparent", corner_radius=0, hover_color= "dark grey", command=self.choose_color)
         choose_color.pack()
 
+        self.image_option = CTkFrame(self.layer, width=50, height=100, corner_radius=50, border_width=None, bg_color="transparent",
+                                fg_color="light grey")
+
+        image_files_button = CTkButton(self.image_option, text="Files", font=("Arial", 12), text_color="black", width=50, height=50,
+                                  fg_color="transparent", corner_radius=0, hover_color= "dark grey", command=self.add_image)
+        image_files_button.pack()
+
+        image_folder_button = CTkButton(self.image_option, text="Folder", font=("Arial", 12), text_color="black", width=50, height=50,
+                                  fg_color="transparent", corner_radius=0, hover_color= "dark grey", command=self.add_image_folder)
+        image_folder_button.pack()
+
     def show_options(self):
+        self.image_option.place_forget()
         self.note_option.place(x=80, rely=0.55, anchor="center")
         self.note_option.lift()
 
+    def show_image_options(self):
+        self.note_option.place_forget()
+        self.image_option.place(x=80, rely=0.65, anchor="center")
+        self.image_option.lift()
+
+    def hide_options(self):
+        self.note_option.place_forget()
+        self.image_option.place_forget()
+
     def is_drag(self):
         self.layer.is_dragging = True
 
@@ -190,49 +232,56 @@ class Toolbar(CTkFrame):
         self.lift()
 
     def add_image(self):
-        file_path = filedialog.askopenfilename(
+        self.hide_options()
+        file_paths = filedialog.askopenfilenames(
             defaultextension=".ects",
             filetypes=[
+                ("Image files", "*.png *.jpg *.jpeg"),
                 ("PNG files", "*.png"),
-                ("JPG files", "*.jpg"),
+                ("JPG files", "*.jpg *.jpeg"),
             ],
         )
 
-        if file_path:
-            self.layer.add_element(ImageBox(self.layer, file_path))
+        if file_paths:
+            self.layer.add_images(list(file_paths))
+
+    def add_image_folder(self):
+        self.hide_options()
+        folder = filedialog.askdirectory()
+
+        if folder:
+            self.layer.add_images(image_files(folder))
 
 
 class Note(CTkTextbox, Selectable):
     def __init__(self, master, width=200, height=200, color="#ffd60a", **kwargs):
         self.color = color
+        self.model = NoteModel(color=color)
         CTkTextbox.__init__(self, master, width, height, fg_color=self.color, text_color="black", **kwargs)
         Selectable.__init__(self, self, master)
+
+        self.bind("<KeyRelease>", self.sync_content)
     
     def get_content(self):
-        return self.get("1.0", "end")
+        return self.get("1.0", "end-1c")
 
     def set_content(self, content, color=None):
         if color:
             self.configure(fg_color=color)
             self.color = color 
+            self.model.color = color
         
         self.delete("1.0", "end")
         self.insert("1.0", content)
-
-    def to_dict(self):
-        return {
-            "type": self.__class__.__name__,
-            "x": self.winfo_x() * 0.8,
-            "y": self.winfo_y() * 0.8,
-            "color": self._fg_color,
-            "content": self.get_content() 
-        }
+        self.model.content = content
 
 class Textbox(CTkFrame, Selectable):
     def __init__(self, master, width = 262, height = 75, box_width = 200, box_height = 50, font_size = 12, **kwargs):
         initial_width = kwargs.pop("width", width)
         initial_height = kwargs.pop("height", height)
-        self.font_size = kwargs.pop("font_size", 12)
+        self.font_size = font_size
+        self.model = TextboxModel(width=initial_width, height=initial_height, box_width=box_width,
+                                  box_height=box_height, font_size=font_size)
 
         CTkFrame.__init__(self, master, width=initial_width, height=initial_height, **kwargs)
         Selectable.__init__(self, self, master)
@@ -246,6 +295,7 @@ class Textbox(CTkFrame, Selectable):
         self.textbox.pack(fill=BOTH, expand=True, padx=5, pady=5)
 
         self.textbox.bind("<Delete>", self.delete_if_selected)
+        self.textbox.bind("<KeyRelease>", self.sync_content)
 
         self.resizer_corner = CTkFrame(self, width=10, height=10, fg_color="dark grey", cursor="bottom_right_corner")
         self.resizer_corner.place(relx=1.0, rely=1.0, anchor="se")
@@ -263,43 +313,44 @@ class Textbox(CTkFrame, Selectable):
         self.resizer_bottom.place(relx=0.25, rely=1.0, anchor="sw", relwidth=0.5)
 
 
-        self.resizer_corner.bind("<B1-Motion>", self.resize_frame)
+        self.resizer_corner.bind("<B1-Motion>", self.coalesce(self.resize_frame))
         self.resizer_corner.bind("<Button-1>", self.start_resizing)
 
-        self.resizer_right.bind("<B1-Motion>", self.resize_frame_width_right)
+        self.resizer_right.bind("<B1-Motion>", self.coalesce(self.resize_frame_width_right))
         self.resizer_right.bind("<Button-1>", self.start_resizing)
 
-        self.resizer_left.bind("<B1-Motion>", self.resize_frame_width_left)
+        self.resizer_left.bind("<B1-Motion>", self.coalesce(self.resize_frame_width_left))
         self.resizer_left.bind("<Button-1>", self.start_resizing)
 
-        self.resizer_bottom.bind("<B1-Motion>", self.resize_frame_height_bottom)
+        self.resizer_bottom.bind("<B1-Motion>", self.coalesce(self.resize_frame_height_bottom))
         self.resizer_bottom.bind("<Button-1>", self.start_resizing)
 
-        self.resizer_top.bind("<B1-Motion>", self.resize_frame_height_top)
+        self.resizer_top.bind("<B1-Motion>", self.coalesce(self.resize_frame_height_top))
         self.resizer_top.bind("<Button-1>", self.start_resizing)
 
+        for resizer in (self.resizer_corner, self.resizer_right, self.resizer_left, self.resizer_bottom, self.resizer_top):
+            resizer.bind("<ButtonRelease-1>", self.stop_resizing)
+
         self.start_x = 0
         self.start_y = 0
         self.start_width = initial_width
         self.start_height = initial_height
         self.start_font_size = self.font_size 
 
-    def delete_if_selected(self, event):
-        if Selectable.selected_object == self:
-            self.deselect()
-            self.destroy()
-
-        self.master.file_parent.save_file_state()
-
     def start_resizing(self, event):
         self.start_x = event.x_root
         self.start_y = event.y_root
-        self.start_width = self.winfo_width()
-        self.start_height = self.winfo_height()
+        self.start_width = self.model.width
+        self.start_height = self.model.height
+
+    def stop_resizing(self, event):
+        self.flush_motion()
+        self.mark_dirty()
 
+    @timed("Textbox.resize_frame")
     def resize_frame(self, event):
-        dx = event.x_root - self.start_x
-        dy = event.y_root - self.start_y
+        dx = (event.x_root - self.start_x) / self.world_scale()
+        dy = (event.y_root - self.start_y) / self.world_scale()
 
         new_width = max(self.start_width + dx, 50)
         new_height = max(self.start_height + dy, 50)
@@ -310,56 +361,59 @@ class Textbox(CTkFrame, Selectable):
         self.font_size = max(new_height / self.start_height * self.start_font_size, 12)
         self.textbox.configure(font=("Arial", self.font_size))
 
+        self.model.width = self.model.box_width = new_width
+        self.model.height = self.model.box_height = new_height
+        self.model.font_size = self.font_size
+
+    @timed("Textbox.resize_frame_width_right")
     def resize_frame_width_right(self, event):
-        dx = event.x_root - self.start_x
+        dx = (event.x_root - self.start_x) / self.world_scale()
         new_width = max(self.start_width + dx, 50) 
 
         self.configure(width=new_width)
         self.textbox.configure(width=new_width)
+        self.model.width = self.model.box_width = new_width
     
+    @timed("Textbox.resize_frame_width_left")
     def resize_frame_width_left(self, event):
-        dx = event.x_root - self.start_x
+        dx = (event.x_root - self.start_x) / self.world_scale()
         new_width = max(self.start_width - dx, 50)
     
         self.configure(width=new_width)
-        print(event.x_root - self.master.winfo_rootx())
         self.textbox.configure(width=new_width)
-        self.place(x=event.x_root - self.master.winfo_rootx(), y=self.winfo_y())
+        x = (event.x_root - self.master.winfo_rootx()) / self._get_widget_scaling()
+        self.model.x = self.layer.model.to_world(x, 0)[0]
+        self.layer.place_element(self)
+        self.model.width = self.model.box_width = new_width
 
+    @timed("Textbox.resize_frame_height_bottom")
     def resize_frame_height_bottom(self, event):
-        dy = event.y_root - self.start_y
+        dy = (event.y_root - self.start_y) / self.world_scale()
         new_height = max(self.start_height + dy, 50)
 
         self.configure(height=new_height)
         self.textbox.configure(height=new_height)
+        self.model.height = self.model.box_height = new_height
     
+    @timed("Textbox.resize_frame_height_top")
     def resize_frame_height_top(self, event):
-        dy = event.y_root - self.start_y
+        dy = (event.y_root - self.start_y) / self.world_scale()
         new_height = max(self.start_height - dy, 50)
 
         self.configure(height=new_height)
         self.textbox.configure(height=new_height)
-        self.place(y=event.y_root - self.master.winfo_rooty(), x=self.winfo_x())
+        y = (event.y_root - self.master.winfo_rooty()) / self._get_widget_scaling()
+        self.model.y = self.layer.model.to_world(0, y)[1]
+        self.layer.place_element(self)
+        self.model.height = self.model.box_height = new_height
 
     def get_content(self):
-        return self.textbox.get("1.0", "end")
+        return self.textbox.get("1.0", "end-1c")
 
     def set_content(self, content):
         self.textbox.delete("1.0", "end")
         self.textbox.insert("1.0", content)
-
-    def to_dict(self):
-        return {
-            "type": self.__class__.__name__,
-            "x": self.widget.winfo_x() * 0.8,
-            "y": self.widget.winfo_y() * 0.8,
-            "width": self.widget.winfo_width(),
-            "height": self.widget.winfo_height(),
-            "box_width": self.textbox.winfo_width() * 0.8,
-            "box_height": self.textbox.winfo_height() * 0.8,
-            "font_size": self.font_size,
-            "content": self.get_content()  
-        }
+        self.model.content = content
 
 class SettingsWindow:
     def __init__(self, master, parent):
@@ -382,6 +436,37 @@ class SettingsWindow:
         help_button = CTkButton(self.settings_frame, text="Help", font=("Arial", 16), fg_color="black", 
                                 hover="gray", command=self.open_help)
         help_button.pack()             
+
+        self.instrument_switch = CTkSwitch(self.settings_frame, text="Instrumentation", command=self.toggle_instrumentation)
+        if instrumentation.enabled:
+            self.instrument_switch.select()
+        self.instrument_switch.pack()
+
+        dump_button = CTkButton(self.settings_frame, text="Dump timings", font=("Arial", 16), fg_color="black", 
+                                hover_color="gray", command=self.dump_timings)
+        dump_button.pack()
+
+        self.profile_button = CTkButton(self.settings_frame, text=self.profile_text(), font=("Arial", 16), 
+                                        fg_color="black", hover_color="gray", command=self.toggle_profile)
+        self.profile_button.pack()
+
+        self.instrument_label = CTkLabel(self.settings_frame, text="", font=("Arial", 12))
+        self.instrument_label.pack()
+
+        history = getattr(parent, "history", None)
+        if history is not None:
+            usage = history.usage()
+            history_label = CTkLabel(self.settings_frame, font=("Arial", 12),
+                                     text=f"Undo history: {usage['bytes'] / 1024:.0f} KB here, {usage['total_bytes'] / 1024:.0f} KB"
+                                          f" of {usage['max_bytes'] / 1024:.0f} KB for all files"
+                                          f" ({usage['undo_steps']} undo, {usage['redo_steps']} redo)")
+            history_label.pack()
+
+        usage = image_cache.usage()
+        image_label = CTkLabel(self.settings_frame, font=("Arial", 12),
+                               text=f"Image cache: {usage['bytes'] / 2 ** 20:.0f} MB of {usage['max_bytes'] / 2 ** 20:.0f} MB"
+                                    f" ({usage['images']} images)")
+        image_label.pack()
     
     def toggle_dark_mode(self):
         if self.dark_mode_switch.get():
@@ -392,30 +477,48 @@ class SettingsWindow:
     def save_settings(self):
         self.parent.save_file_state()
 
+    def toggle_instrumentation(self):
+        instrumentation.set_enabled(bool(self.instrument_switch.get()))
+
+    def dump_timings(self):
+        if not instrumentation.timings:
+            self.instrument_label.configure(text="No timings recorded yet: turn on Instrumentation first")
+            return
+        path = instrumentation.dump()
+        self.instrument_label.configure(text=f"Timings and latency histograms written to {path}")
+
+    def profile_text(self):
+        return "Stop profiling" if instrumentation.profiling() else "Start profiling"
+
+    def toggle_profile(self):
+        # Runs until stopped, even with this window closed; reopening Settings shows the Stop button.
+        if instrumentation.profiling():
+            path = instrumentation.stop_profile()
+            self.instrument_label.configure(text=f"Profile written to {path}")
+        else:
+            instrumentation.start_profile()
+            self.instrument_label.configure(text="Profiling...")
+        self.profile_button.configure(text=self.profile_text())
+
     def open_help(self):
         help_window = CTkToplevel(self.top)
         help_window.title("Help")
         help_window.geometry("400x200")
-        help_label = CTkLabel(help_window, text="To delete press the detele button \nTo delete image double-right-click  \n To Save press ctrl + S \n")
+        help_label = CTkLabel(help_window, text="To delete press the detele button \nTo delete image double-right-click  \n To Save press ctrl + S \nTo Undo press ctrl + Z, to Redo ctrl + Y \n")
         help_label.pack()
 
 
 class ImageBox(CTkFrame, Selectable):
     def __init__(self, master, image_path, width = 262, height = 75, box_width = 200, box_height = 50, image: Image = None, **kwargs):
         self.path = image_path
-        self.pil_img = Image.open(image_path)
-
-        self.img_ratio = self.pil_img.width / self.pil_img.height
+        # The model was sized from the image header when it was imported, so its shape is the image's
+        # ratio; nothing is read from disk on the Tk thread, and a broken file just keeps its placeholder.
+        self.img_ratio = width / height if width > 0 and height > 0 else 1
 
         fixed_dims = self.fix_ratio(width, height, self.img_ratio, True)
         width = fixed_dims[0]
         height = fixed_dims[1]
-
-        self.img = CTkImage(
-            light_image=self.pil_img,
-            dark_image=self.pil_img,
-            size=(width, height)
-        )
+        self.model = ImageBoxModel(width=width, height=height, box_width=box_width, image_path=image_path)
 
         initial_width = kwargs.pop("width", width)
         initial_height = kwargs.pop("height", height)
@@ -427,8 +530,12 @@ class ImageBox(CTkFrame, Selectable):
 
         self.place(x=50, y=50)
 
-        self.label = CTkLabel(self, width=box_width, height=box_height, image=self.img, text="")
+        # A sized placeholder shows at once; the decoded image is swapped in by show_image.
+        self.img = None
+        self.image_request = None
+        self.label = CTkLabel(self, width=width, height=height, text="", fg_color=PLACEHOLDER_COLOR)
         self.label.pack(fill=BOTH, expand=True, padx=5, pady=5)
+        self.request_image((width, height))
 
         self.resizer_corner_se = CTkFrame(self, width=10, height=10, fg_color="dark grey", cursor="bottom_right_corner")
         self.resizer_corner_se.place(relx=1.0, rely=1.0, anchor="se")
@@ -437,14 +544,17 @@ class ImageBox(CTkFrame, Selectable):
 
         self.resizer_bottom = CTkFrame(self, height=5, width=initial_height, fg_color="grey", cursor="sb_v_double_arrow")
 
-        self.resizer_corner_se.bind("<B1-Motion>", self.resize_frame_se)
+        self.resizer_corner_se.bind("<B1-Motion>", self.coalesce(self.resize_frame_se))
         self.resizer_corner_se.bind("<Button-1>", self.start_resizing)
 
-        self.resizer_right.bind("<B1-Motion>", self.resize_frame_width_right)
+        self.resizer_right.bind("<B1-Motion>", self.coalesce(self.resize_frame_width_right))
         self.resizer_right.bind("<Button-1>", self.start_resizing)
 
-        self.resizer_bottom.bind("<B1-Motion>", self.resize_frame_height_bottom)
-        self.resizer_bottom.bind( self.start_resizing)
+        self.resizer_bottom.bind("<B1-Motion>", self.coalesce(self.resize_frame_height_bottom))
+        self.resizer_bottom.bind("<Button-1>", self.start_resizing)
+
+        for resizer in (self.resizer_corner_se, self.resizer_right, self.resizer_bottom):
+            resizer.bind("<ButtonRelease-1>", self.stop_resizing)
 
         self.start_x = 0
         self.start_y = 0
@@ -453,13 +563,6 @@ class ImageBox(CTkFrame, Selectable):
 
         self.label.bind("<Double-Button-3>", self.delete_if_selected)
 
-    def delete_if_selected(self, event):
-        if Selectable.selected_object == self:
-            self.deselect()
-            self.destroy()
-
-        self.master.file_parent.save_file_state()
-
     def show_resizers(self):
         self.resizer_right.place(relx=1.0, rely=0.25, anchor="ne", relheight=0.5)
         self.resizer_bottom.place(relx=0.25, rely=1.0, anchor="sw", relwidth=0.5)
@@ -474,34 +577,53 @@ class ImageBox(CTkFrame, Selectable):
         else:
             return (in_height * ratio, in_height)
 
-    def delete_if_selected(self, event):
-        if Selectable.selected_object == self:
-            self.deselect()
-            self.destroy()
-
-        self.master.file_parent.save_file_state()
-
     def start_resizing(self, event):
         self.start_x = event.x_root
         self.start_y = event.y_root
-        self.start_width = self.winfo_width()
-        self.start_height = self.winfo_height()
-    
-
+        self.start_width = self.model.width
+        self.start_height = self.model.height
+
+    def stop_resizing(self, event):
+        self.flush_motion()
+        self.request_image((self.model.width, self.model.height))
+        self.mark_dirty()
+
+    def request_image(self, size):
+        scaling = self._get_widget_scaling()
+        self.image_request = request = object()
+        image_loader.request(self, self.path, (size[0] * scaling, size[1] * scaling),
+                             lambda image: self.show_image(request, image))
+
+    def show_image(self, request, image):
+        # Only the latest request counts; earlier ones may finish out of order.
+        if request is not self.image_request or image is None or not self.winfo_exists():
+            return
+        self.img = self.make_image(image)
+        self.label.configure(image=self.img, fg_color="transparent")
+
+    def make_image(self, image):
+        scaling = self._get_widget_scaling()
+        return CTkImage(light_image=image, dark_image=image, size=(image.width / scaling, image.height / scaling))
+
+    def render_image(self, size, fast=False):
+        # Drags reuse whatever resolution is cached; the final render decodes more detail in the background.
+        levels = image_cache.cached(self.path)
+        if levels is None:
+            return self.img
+        scaling = self._get_widget_scaling()
+        return self.make_image(render_from_pyramid(levels, (size[0] * scaling, size[1] * scaling), fast))
+
+    @timed("ImageBox.resize_frame_se")
     def resize_frame_se(self, event):
-        dx = event.x_root - self.start_x
-        dy = event.y_root - self.start_y
+        dx = (event.x_root - self.start_x) / self.world_scale()
+        dy = (event.y_root - self.start_y) / self.world_scale()
 
         new_width = max(self.start_width + dx, 50)
         new_height = max(self.start_height + dy, 50)
 
         fixed_dims = self.fix_ratio(new_width, new_height, self.img_ratio, True)
 
-        self.img = CTkImage(
-            light_image=self.pil_img,
-            dark_image=self.pil_img,
-            size=fixed_dims
-        )
+        self.img = self.render_image(fixed_dims, fast=True)
 
         new_width = fixed_dims[0]
         new_height = fixed_dims[1]
@@ -510,17 +632,16 @@ class ImageBox(CTkFrame, Selectable):
         self.configure(width=new_width, height=new_height)
         self.label.configure(image=self.img)
         self.label.configure(width=new_width, height=new_height)
+        self.model.width = self.model.box_width = new_width
+        self.model.height = new_height
 
+    @timed("ImageBox.resize_frame_width_right")
     def resize_frame_width_right(self, event):
-        dx = event.x_root - self.start_x
+        dx = (event.x_root - self.start_x) / self.world_scale()
         new_width = max(self.start_width + dx, 50) 
         fixed_dims = self.fix_ratio(new_width, self.start_height, self.img_ratio, new_width>self.start_width)
 
-        self.img = CTkImage(
-            light_image=self.pil_img,
-            dark_image=self.pil_img,
-            size=fixed_dims
-        )
+        self.img = self.render_image(fixed_dims, fast=True)
 
         new_width = fixed_dims[0]
         new_height = fixed_dims[1]
@@ -528,19 +649,18 @@ class ImageBox(CTkFrame, Selectable):
         self.configure(width=new_width, height=new_height)
         self.label.configure(image=self.img)
         self.label.configure(width=new_width, height=new_height)
+        self.model.width = self.model.box_width = new_width
+        self.model.height = new_height
 
 
+    @timed("ImageBox.resize_frame_height_bottom")
     def resize_frame_height_bottom(self, event):
-        dy = event.y_root - self.start_y
+        dy = (event.y_root - self.start_y) / self.world_scale()
         new_height = max(self.start_height + dy, 50)
 
         fixed_dims = self.fix_ratio(self.start_width, new_height, self.img_ratio, new_height>self.start_height)
 
-        self.img = CTkImage(
-            light_image=self.pil_img,
-            dark_image=self.pil_img,
-            size=fixed_dims
-        )
+        self.img = self.render_image(fixed_dims, fast=True)
 
         new_width = fixed_dims[0]
         new_height = fixed_dims[1]
@@ -548,6 +668,8 @@ class ImageBox(CTkFrame, Selectable):
         self.configure(width=new_width, height=new_height)
         self.label.configure(image=self.img)
         self.label.configure(width=new_width, height=new_height)
+        self.model.width = self.model.box_width = new_width
+        self.model.height = new_height
 
     def get_content(self):
         pass
@@ -555,22 +677,12 @@ class ImageBox(CTkFrame, Selectable):
     def set_content(self, content):
         pass
 
-    def to_dict(self):
-        return {
-            "type": self.__class__.__name__,
-            "x": self.widget.winfo_x() * 0.8,
-            "y": self.widget.winfo_y() * 0.8,
-            "width": self.widget.winfo_width(),
-            "height": self.widget.winfo_height(),
-            "box_width": self.label.winfo_width() * 0.8,
-            "image_path": self.path,
-        }
-
 
 class Scene(CTkFrame, Selectable):
     def __init__(self, master, name = "Scene", width = 250, height = 200, corner_radius = None, border_width = None, bg_color = "transparent", fg_color = "#252525", border_color = None, background_corner_colors = None, overwrite_preferred_drawing_method = None, **kwargs):
         CTkFrame.__init__(self, master, width, height, corner_radius, border_width, bg_color, fg_color, border_color,       
                           background_corner_colors, overwrite_preferred_drawing_method, **kwargs)
+        self.model = SceneModel(name=name)
         Selectable.__init__(self, self, master)
 
         self.name = name
@@ -584,29 +696,49 @@ class Scene(CTkFrame, Selectable):
         self.textbox.pack(side = TOP, fill = BOTH)
 
         self.textbox.bind("<Delete>", self.delete_if_selected)
+        self.textbox.bind("<KeyRelease>", self.sync_content)
+        self.title.bind("<KeyRelease>", self.sync_name)
 
     def get_content(self):
-        return self.textbox.get("1.0", "end")
+        return self.textbox.get("1.0", "end-1c")
 
     def set_content(self, content, name=None):
         if name:
-            self.title.delete("1.0", "end")
-            self.title.insert("1.0", name)
+            self.set_name(name)
         self.textbox.delete("1.0", "end")
         self.textbox.insert("1.0", content)
+        self.model.content = content
 
-    def delete_if_selected(self, event):
-        if Selectable.selected_object == self:
-            self.deselect()
-            self.destroy()
-
-        self.master.file_parent.save_file_state()
-
-    def to_dict(self):
-        return {
-            "type": self.__class__.__name__,
-            "name": self.title.get("1.0", "end"),
-            "x": self.winfo_x() * 0.8,
-            "y": self.winfo_y() * 0.8,
-            "content": self.get_content(),
-        }
\ No newline at end of file
+    def set_name(self, name):
+        self.name = name
+        self.title.delete("1.0", "end")
+        self.title.insert("1.0", name)
+        self.model.name = name
+
+    def sync_name(self, event=None):
+        self.model.name = self.title.get("1.0", "end-1c")
+        self.mark_dirty()
+
+
+def create_element(layer, model):
+    if isinstance(model, NoteModel):
+        element = Note(layer, width=200, height=200, color=model.color)
+        element.model = model
+        element.set_content(model.content, color=model.color)
+    elif isinstance(model, TextboxModel):
+        element = Textbox(layer, width=model.width, height=model.height, box_width=model.box_width,
+                          box_height=model.box_height, font_size=model.font_size)
+        element.model = model
+        element.set_content(model.content)
+    elif isinstance(model, SceneModel):
+        element = Scene(layer, name=model.name)
+        element.model = model
+        element.set_content(model.content, model.name)
+    elif isinstance(model, ImageBoxModel):
+        if not os.path.exists(model.image_path):
+            return None
+        element = ImageBox(layer, model.image_path, width=model.width, height=model.height, box_width=model.box_width)
+        element.model = model
+    else:
+        return None
+    return element
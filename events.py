@@ -0,0 +1,53 @@
+import time
+
+FRAME_INTERVAL = 1 / 60
+
+
+class MotionCoalescer:
+    received_total = 0
+    applied_total = 0
+
+    def __init__(self, widget, handler, interval=FRAME_INTERVAL):
+        self.widget = widget
+        self.handler = handler
+        self.interval = interval
+        self.pending_event = None
+        self.after_id = None
+        self.last_applied = 0.0
+        self.received = 0
+        self.applied = 0
+
+    @property
+    def dropped(self):
+        return self.received - self.applied
+
+    def __call__(self, event):
+        self.received += 1
+        MotionCoalescer.received_total += 1
+        self.pending_event = event
+
+        if self.after_id is None:
+            wait = self.last_applied + self.interval - time.perf_counter()
+            self.after_id = self.widget.after(max(int(wait * 1000), 0), self.apply)
+
+    def apply(self):
+        self.after_id = None
+        event, self.pending_event = self.pending_event, None
+        if event is None:
+            return
+
+        self.applied += 1
+        MotionCoalescer.applied_total += 1
+        self.last_applied = time.perf_counter()
+        self.handler(event)
+
+    def flush(self):
+        if self.after_id is not None:
+            self.widget.after_cancel(self.after_id)
+        self.apply()
+
+
+def coalescing_stats():
+    received = MotionCoalescer.received_total
+    applied = MotionCoalescer.applied_total
+    return {"received": received, "applied": applied, "dropped": received - applied}
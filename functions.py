@@ -1,4 +1,30 @@
-from customtkinter import get_appearance_mode
+from customtkinter import CTkImage, get_appearance_mode
+from PIL import Image
+import json
+import os
+
+ICON_DIR = "images"
+ATLAS_IMAGE = os.path.join(ICON_DIR, "atlas.png")
+ATLAS_INDEX = os.path.join(ICON_DIR, "atlas.json")
+
+PRELOADED_ICONS = [
+    ("cursor.png", (20, 20)),
+    ("hand.png", (30, 30)),
+    ("Textbox.png", (20, 20)),
+    ("Note.png", (30, 30)),
+    ("Image.png", (20, 20)),
+    ("Scene.png", (20, 20)),
+    ("yellow.png", (30, 30)),
+    ("colorwheel.png", (30, 30)),
+    ("delete.png", (20, 20)),
+    ("home.png", (20, 20)),
+    ("setting.png", (20, 20)),
+    ("Rename.png", (20, 20)),
+]
+
+_images = {}
+_icons = {}
+_atlas = None
 
 def truncate_name(name, max_length=20):
     if len(name) > max_length:
@@ -10,4 +36,42 @@ def get_color():
     if current_mode == "dark":
         return "white" 
     else:
-        return "black"
\ No newline at end of file
+        return "black"
+
+def load_atlas():
+    global _atlas
+    if _atlas is None:
+        try:
+            with open(ATLAS_INDEX, encoding="utf-8") as f:
+                boxes = json.load(f)
+            with Image.open(ATLAS_IMAGE) as source:
+                source.load()
+                _atlas = (source.copy(), boxes)
+        except (OSError, ValueError):
+            _atlas = (None, {})
+    return _atlas
+
+def load_image(name):
+    image = _images.get(name)
+    if image is None:
+        sheet, boxes = load_atlas()
+        if name in boxes:
+            x, y, width, height = boxes[name]
+            image = sheet.crop((x, y, x + width, y + height))
+        else:
+            with Image.open(os.path.join(ICON_DIR, name)) as source:
+                source.load()
+                image = source.copy()
+        _images[name] = image
+    return image
+
+def load_icon(name, size=(20, 20)):
+    key = (name, size)
+    icon = _icons.get(key)
+    if icon is None:
+        icon = _icons[key] = CTkImage(load_image(name), size=size)
+    return icon
+
+def preload_icons():
+    for name, size in PRELOADED_ICONS:
+        load_icon(name, size)
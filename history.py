@@ -0,0 +1,109 @@
+import itertools
+import json
+import os
+from collections import OrderedDict, deque
+
+HISTORY_LIMIT = int(os.environ.get("KOUAN_UNDO_LIMIT", 4 * 1024 * 1024))
+
+
+class HistoryBudget:
+    # One byte budget for the undo histories of every open file; the oldest entry anywhere goes first.
+    def __init__(self, max_bytes=HISTORY_LIMIT):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict()
+        self.serials = itertools.count()
+
+    def add(self, history, size):
+        serial = next(self.serials)
+        self.entries[serial] = (history, size)
+        self.used_bytes += size
+        return serial
+
+    def release(self, serial):
+        _, size = self.entries.pop(serial, (None, 0))
+        self.used_bytes -= size
+
+    def evict(self):
+        while self.used_bytes > self.max_bytes and self.entries:
+            serial, (history, size) = self.entries.popitem(last=False)
+            self.used_bytes -= size
+            history.drop(serial)
+
+    def usage(self):
+        return {
+            "histories": len({id(history) for history, _ in self.entries.values()}),
+            "entries": len(self.entries),
+            "bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+undo_budget = HistoryBudget()
+
+
+class UndoHistory:
+    def __init__(self, budget=undo_budget):
+        self.budget = budget
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.used_bytes = 0
+
+    def record(self, ops, mode=None):
+        if not ops:
+            return
+        if mode == "undo":
+            self.push(self.redo_stack, ops)
+        elif mode == "redo":
+            self.push(self.undo_stack, ops)
+        else:
+            self.clear(self.redo_stack)
+            self.push(self.undo_stack, ops)
+
+    def push(self, stack, ops):
+        # Entries are kept serialized: compact, immune to later mutation and exactly measurable.
+        entry = json.dumps(ops, separators=(",", ":"))
+        stack.append((self.budget.add(self, len(entry)), entry))
+        self.used_bytes += len(entry)
+        self.budget.evict()
+
+    def drop(self, serial):
+        # Called by the budget with this history's oldest entry, which sits at the bottom of a stack.
+        for stack in (self.undo_stack, self.redo_stack):
+            if stack and stack[0][0] == serial:
+                self.used_bytes -= len(stack.popleft()[1])
+                return
+
+    def pop(self, stack):
+        if not stack:
+            return None
+        serial, entry = stack.pop()
+        self.budget.release(serial)
+        self.used_bytes -= len(entry)
+        return json.loads(entry)
+
+    def pop_undo(self):
+        return self.pop(self.undo_stack)
+
+    def pop_redo(self):
+        return self.pop(self.redo_stack)
+
+    def clear(self, stack):
+        while stack:
+            serial, entry = stack.pop()
+            self.budget.release(serial)
+            self.used_bytes -= len(entry)
+
+    def close(self):
+        self.clear(self.undo_stack)
+        self.clear(self.redo_stack)
+
+    def usage(self):
+        usage = self.budget.usage()
+        return {
+            "undo_steps": len(self.undo_stack),
+            "redo_steps": len(self.redo_stack),
+            "bytes": self.used_bytes,
+            "total_bytes": usage["bytes"],
+            "max_bytes": usage["max_bytes"],
+        }
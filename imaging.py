@@ -0,0 +1,215 @@
+import logging
+import os
+import queue
+import threading
+import tkinter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from instrumentation import timed
+
+MIN_LEVEL_SIZE = 64
+IMAGE_BUDGET = int(os.environ.get("KOUAN_IMAGE_BUDGET", 256 * 1024 * 1024))
+LOADER_THREADS = min(4, os.cpu_count() or 1)
+POLL_INTERVAL = 15
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff")
+
+logger = logging.getLogger(__name__)
+
+
+def build_pyramid(image, min_size=MIN_LEVEL_SIZE):
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    levels = [image]
+    while min(levels[-1].size) >= min_size * 2:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+
+def pyramid_bytes(levels):
+    return sum(level.width * level.height * len(level.getbands()) for level in levels)
+
+
+@timed("imaging.load_pyramid")
+def load_pyramid(image_path, size=None):
+    with Image.open(image_path) as source:
+        full_size = source.size
+        if size is not None:
+            # Only JPEG honours draft: it decodes at the smallest 1/2, 1/4 or 1/8 scale still covering size.
+            source.draft(source.mode, (max(int(size[0]), 1), max(int(size[1]), 1)))
+        source.load()
+        levels = build_pyramid(source.copy())
+    return levels, levels[0].size == full_size
+
+
+def covers(image, size):
+    return image.width >= int(round(size[0])) and image.height >= int(round(size[1]))
+
+
+class ImageCache:
+    def __init__(self, max_bytes=IMAGE_BUDGET):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        # Loader threads share the cache: one lock guards the entries, one per path keeps
+        # two threads from decoding the same file at once.
+        self.lock = threading.RLock()
+        self.path_locks = {}
+
+    def path_lock(self, image_path):
+        with self.lock:
+            lock = self.path_locks.get(image_path)
+            if lock is None:
+                lock = self.path_locks[image_path] = threading.Lock()
+            return lock
+
+    def cached(self, image_path):
+        with self.lock:
+            entry = self.entries.get(image_path)
+            if entry is None:
+                return None
+            self.entries.move_to_end(image_path)
+            return entry[0]
+
+    def lookup(self, image_path, size=None):
+        with self.lock:
+            entry = self.entries.get(image_path)
+            if entry is None:
+                return None
+            levels, complete, _ = entry
+            if not (complete or (size is not None and covers(levels[0], size))):
+                return None
+            self.entries.move_to_end(image_path)
+            return levels
+
+    def get(self, image_path, size=None):
+        with self.path_lock(image_path):
+            levels = self.lookup(image_path, size)
+            if levels is None:
+                levels, complete = load_pyramid(image_path, size)
+                self.put(image_path, levels, complete)
+            return levels
+
+    def put(self, image_path, levels, complete):
+        used = pyramid_bytes(levels)
+        with self.lock:
+            self.discard(image_path)
+            self.entries[image_path] = (levels, complete, used)
+            self.used_bytes += used
+            self.evict()
+
+    def discard(self, image_path):
+        with self.lock:
+            entry = self.entries.pop(image_path, None)
+            if entry is not None:
+                self.used_bytes -= entry[2]
+
+    def evict(self):
+        # The newest entry always stays, even when it alone is over budget.
+        with self.lock:
+            while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, _, used) = self.entries.popitem(last=False)
+                self.used_bytes -= used
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+    def usage(self):
+        with self.lock:
+            return {"images": len(self.entries), "bytes": self.used_bytes, "max_bytes": self.max_bytes}
+
+
+image_cache = ImageCache()
+
+
+class ImageLoader:
+    # Decodes and resizes on worker threads; results come back to the Tk thread through a queue
+    # drained by an after() poll that only runs while requests are outstanding.
+    def __init__(self, threads=LOADER_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="image-loader")
+        self.results = queue.Queue()
+        self.pending = 0
+        self.poll_widget = None
+
+    def request(self, widget, image_path, size, callback, render=True):
+        self.pending += 1
+        self.executor.submit(self.load, image_path, size, callback, render)
+        if self.poll_widget is None or not exists(self.poll_widget):
+            self.poll_widget = widget.winfo_toplevel()
+            self.poll_widget.after(POLL_INTERVAL, self.poll)
+
+    def load(self, image_path, size, callback, render):
+        # Every request must answer, or pending never drops to zero and poll() keeps running.
+        result = None
+        try:
+            levels = image_cache.get(image_path, size)
+            result = render_from_pyramid(levels, size) if render else levels
+        except (OSError, ValueError):
+            pass
+        except Exception:
+            # DecompressionBombError, MemoryError and the like: show the placeholder instead.
+            logger.exception("loading %s failed", image_path)
+        finally:
+            self.results.put((callback, result))
+
+    def poll(self):
+        try:
+            while True:
+                try:
+                    callback, result = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                self.pending -= 1
+                callback(result)
+        finally:
+            if self.pending:
+                self.poll_widget.after(POLL_INTERVAL, self.poll)
+            else:
+                self.poll_widget = None
+
+
+image_loader = ImageLoader()
+
+
+def image_files(folder):
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(folder, name) for name in names]
+
+
+def read_size(image_path):
+    try:
+        with Image.open(image_path) as source:
+            return source.size
+    except (OSError, ValueError):
+        return None
+
+
+def read_sizes(image_paths):
+    # Header reads are mostly waiting on the disk, so they overlap well on the loader threads.
+    return list(image_loader.executor.map(read_size, image_paths))
+
+
+def exists(widget):
+    try:
+        return bool(widget.winfo_exists())
+    except tkinter.TclError:
+        return False
+
+
+def pick_level(levels, width, height):
+    for level in reversed(levels):
+        if level.width >= width and level.height >= height:
+            return level
+    return levels[0]
+
+
+def render_from_pyramid(levels, size, fast=False):
+    width = max(int(round(size[0])), 1)
+    height = max(int(round(size[1])), 1)
+    level = pick_level(levels, width, height)
+    resample = Image.Resampling.BILINEAR if fast else Image.Resampling.LANCZOS
+    return level.resize((width, height), resample)
@@ -0,0 +1,127 @@
+import bisect
+import functools
+import io
+import json
+import os
+import threading
+import time
+
+from events import coalescing_stats
+
+STATS_PATH = "kouan_stats.json"
+PROFILE_PATH = "kouan_profile.prof"
+
+# Upper bounds of the latency buckets, in milliseconds; the last bucket is open-ended.
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+enabled = os.environ.get("KOUAN_INSTRUMENT", "") not in ("", "0")
+timings = {}
+# @timed functions also run on the writer and image loader threads.
+timings_lock = threading.Lock()
+profiler = None
+
+
+class Timing:
+    __slots__ = ("count", "total", "max", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, elapsed):
+        milliseconds = elapsed * 1000
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+        self.histogram[bisect.bisect_left(BUCKETS, milliseconds)] += 1
+
+    def to_dict(self):
+        labels = [f"<={bound}ms" for bound in BUCKETS] + [f">{BUCKETS[-1]}ms"]
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+def set_enabled(flag):
+    global enabled
+    enabled = flag
+
+
+def record(name, elapsed):
+    with timings_lock:
+        timing = timings.get(name)
+        if timing is None:
+            timing = timings[name] = Timing()
+        timing.add(elapsed)
+
+
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def stats():
+    with timings_lock:
+        timing_stats = {name: timing.to_dict() for name, timing in sorted(timings.items())}
+    return {
+        "timings": timing_stats,
+        "motion_events": coalescing_stats(),
+    }
+
+
+def reset():
+    with timings_lock:
+        timings.clear()
+
+
+def dump(path=STATS_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats(), f, indent=2)
+    return os.path.abspath(path)
+
+
+def profiling():
+    return profiler is not None
+
+
+def start_profile():
+    # cProfile and pstats cost more to import than the rest of this module, and are rarely used.
+    import cProfile
+
+    global profiler
+    if profiler is None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def stop_profile(path=PROFILE_PATH):
+    global profiler
+    if profiler is None:
+        return None
+    import pstats
+
+    profiler.disable()
+    profiler.dump_stats(path)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+    with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+        f.write(summary.getvalue())
+    profiler = None
+    return os.path.abspath(path)
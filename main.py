@@ -1,53 +1,193 @@
+import time
+STARTUP_BEGIN = time.perf_counter()
+
 from elements import *
 from pages import *
-import pickle
+from storage import (AutosaveWriter, JOURNAL_PATH, LEGACY_STATE_PATH, STATE_PATH, assign_ids, copy_state,
+                     load_snapshot, read_journal, replay, write_atomic)
+import stateformat
+from search import INDEX_PATH, IndexBuild, dump_index, load_index
+import instrumentation
+from instrumentation import timed
 import os
+import queue
+import sys
+
+IMPORTS_DONE = time.perf_counter()
+
+STORAGE_BACKEND = os.environ.get("KOUAN_STORAGE", "file")
+STARTUP_TIMING = os.environ.get("KOUAN_STARTUP", "") not in ("", "0")
+STORAGE_CHECK_INTERVAL = 1000
+INDEX_CHECK_INTERVAL = 100
 
-def save_app_state(app_state, file_path="app_state.pkl"):
-    with open(file_path, "wb") as f:
-        pickle.dump(app_state, f)
+def save_app_state(app_state, file_path=STATE_PATH):
+    write_atomic(file_path, stateformat.dumps(app_state))
 
-def load_app_state(file_path="app_state.pkl"):
-    try: 
-        os.path.exists(file_path)
-        with open(file_path, "rb") as f:
-            content = pickle.load(f)
-            return content
-    except:
-        return None 
+def load_app_state(file_path=STATE_PATH, journal_path=JOURNAL_PATH, legacy_path=LEGACY_STATE_PATH):
+    app_state = load_snapshot(file_path)
+    migrated = False
+    if app_state is None and legacy_path and os.path.exists(legacy_path):
+        # First start after the format change: the old pickle is read once and rewritten.
+        try:
+            app_state = stateformat.load_legacy(legacy_path)
+            migrated = True
+        except (OSError, stateformat.FormatError):
+            pass
+    app_state = app_state or {"files": []}
+    ops, _ = read_journal(journal_path)
+    replay(app_state, ops)
+
+    if assign_ids(app_state) or migrated:
+        save_app_state(app_state, file_path)
+    return app_state
 
 class App(CTk):
     def __init__(self):
         super().__init__()
         self.minsize(width=600, height=550)
         self.title("Kouan: Storyboard")
+        self.startup_marks = [("imports", IMPORTS_DONE)]
 
-        self.app_state = load_app_state()
+        if STORAGE_BACKEND == "sqlite":
+            # sqlite3 is only imported when this backend is selected.
+            from sqlite_store import SQLiteWriter, load_sqlite_state
+
+            self.app_state = load_sqlite_state(load_legacy=load_app_state)
+            self.writer = SQLiteWriter(seq=self.app_state["journal_seq"])
+        else:
+            self.app_state = load_app_state()
+            self.writer = AutosaveWriter(seq=self.app_state["journal_seq"])
+        self._search_index = None
+        self._index_build = None
+        self.startup_marks.append(("load state", time.perf_counter()))
 
-        if not self.app_state:
-            self.app_state = {
-                "files": [],
-            }
-        
         self.view = MainView(self, app_state=self.app_state)
         self.view.pack(side=TOP, fill=BOTH, expand=True)
+        self.storage_banner = CTkLabel(self, text="", fg_color="#b00020", text_color="white", font=("Arial", 14))
+        self.startup_marks.append(("build menu", time.perf_counter()))
         
         self.bind('<Control-s>', self.save_state)
+        self.bind('<Control-z>', self.view.controller.undo)
+        self.bind('<Control-y>', self.view.controller.redo)
+        self.bind('<Control-Z>', self.view.controller.redo)
+        self.bind('<Control-0>', self.view.controller.reset_zoom)
+        self.protocol("WM_DELETE_WINDOW", self.quit_app)
 
         self.auto_save_interval = 5 * 60 * 1000  # 5 minutes in milliseconds
         self.start_autosave()
+        self.after(STORAGE_CHECK_INTERVAL, self.check_storage)
+        self.after(0, self.first_frame)
+
+    def first_frame(self):
+        self.update_idletasks()
+        self.startup_marks.append(("first frame", time.perf_counter()))
+        if STARTUP_TIMING:
+            self.report_startup()
+            self.after_idle(self.quit_app)
+            return
+        # Everything the menu does not need is warmed up once the window is on screen.
+        self.after_idle(self.warm_up)
+
+    def warm_up(self):
+        preload_icons()
+        self.load_search_index()
+
+    def report_startup(self):
+        previous = STARTUP_BEGIN
+        for name, mark in self.startup_marks:
+            print(f"{name:<12} {(mark - previous) * 1000:8.1f} ms")
+            previous = mark
+        print(f"{'time to first frame':<12} {(previous - STARTUP_BEGIN) * 1000:8.1f} ms")
+
+    def load_search_index(self):
+        if self._search_index is not None or self._index_build is not None:
+            return
+        self._search_index = load_index(INDEX_PATH, self.app_state)
+        if self._search_index is None:
+            # Rebuilding reads every storyboard, so it runs on a copy off the Tk thread.
+            self._index_build = IndexBuild(copy_state(self.app_state))
+            self.after(INDEX_CHECK_INTERVAL, self.check_index_build)
+
+    def check_index_build(self):
+        if self._index_build is None:
+            return
+        if self._index_build.is_alive():
+            self.after(INDEX_CHECK_INTERVAL, self.check_index_build)
+            return
+        self.finish_index_build()
+
+    def finish_index_build(self):
+        build, self._index_build = self._index_build, None
+        self._search_index = build.finish()
+
+    @property
+    def search_index(self):
+        self.load_search_index()
+        if self._index_build is not None:
+            # A search typed before the rebuild is done waits for it.
+            self.finish_index_build()
+        return self._search_index
 
     def save_state(self, event=None):
-        save_app_state(self.app_state)
+        self.view.controller.flush_files()
+        self.save_search_index()
+
+    def save_search_index(self):
+        if self._search_index is not None and self._search_index.dirty:
+            entries = self.search_index.snapshot()
+            writer = self.writer
+            writer.call(lambda: dump_index(INDEX_PATH, writer.seq, entries))
+
+    def check_storage(self):
+        while True:
+            try:
+                notice, message = self.writer.notices.get_nowait()
+            except queue.Empty:
+                break
+            if notice == "ok":
+                self.storage_banner.pack_forget()
+                continue
+            self.show_notice(f"Changes could not be saved: {message}. Retrying...")
+            if notice == "snapshot":
+                self.writer.snapshot(copy_state(self.app_state))
+        self.after(STORAGE_CHECK_INTERVAL, self.check_storage)
+
+    def show_notice(self, text):
+        self.storage_banner.configure(text=text)
+        self.storage_banner.pack(side=TOP, fill=X, before=self.view)
+
+    def record_ops(self, ops):
+        self.writer.record(ops)
+        self.load_search_index()
+        if self._index_build is not None:
+            self._index_build.ops.extend(ops)
+        else:
+            self._search_index.apply_ops(ops)
+
+    def quit_app(self):
+        self.save_state()
+        self.destroy()
 
+    @timed("App.autosave")
     def start_autosave(self):
         self.save_state()
+        self.writer.compact()
         self.after(self.auto_save_interval, self.start_autosave)
 
 
 def main():
     app = App()
     app.mainloop()
+    app.writer.close()
+    if app.writer.failed:
+        # Last chance for ops the journal refused: the writer thread is gone, so write the snapshot here.
+        app.writer.write_snapshot(copy_state(app.app_state))
+        if app.writer.failed:
+            print(f"Kouan: {len(app.writer.failed)} changes could not be saved", file=sys.stderr)
+    if instrumentation.enabled:
+        instrumentation.dump()
+    # A profile left running from the settings window is written rather than lost.
+    instrumentation.stop_profile()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
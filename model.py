@@ -0,0 +1,156 @@
+import uuid
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+class ElementModel:
+    __slots__ = ("id", "x", "y")
+    fields = ("x", "y")
+
+    def __init__(self, x=0, y=0, id=None):
+        self.id = id or new_id()
+        self.x = x
+        self.y = y
+
+    @property
+    def type_name(self):
+        return self.__class__.__name__[:-len("Model")]
+
+    def to_dict(self):
+        data = {"type": self.type_name, "id": self.id}
+        for field in self.fields:
+            data[field] = getattr(self, field)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(id=data.get("id"))
+        for field in cls.fields:
+            if field in data:
+                setattr(model, field, data[field])
+        return model
+
+
+class NoteModel(ElementModel):
+    __slots__ = ("color", "content")
+    fields = ("x", "y", "color", "content")
+    width = 200
+    height = 200
+
+    def __init__(self, x=0, y=0, color="#ffd60a", content="", id=None):
+        super().__init__(x, y, id)
+        self.color = color
+        self.content = content
+
+
+class TextboxModel(ElementModel):
+    __slots__ = ("width", "height", "box_width", "box_height", "font_size", "content")
+    fields = ("x", "y", "width", "height", "box_width", "box_height", "font_size", "content")
+
+    def __init__(self, x=0, y=0, width=262, height=75, box_width=200, box_height=50, font_size=12, content="", id=None):
+        super().__init__(x, y, id)
+        self.width = width
+        self.height = height
+        self.box_width = box_width
+        self.box_height = box_height
+        self.font_size = font_size
+        self.content = content
+
+
+class SceneModel(ElementModel):
+    __slots__ = ("name", "content")
+    fields = ("name", "x", "y", "content")
+    width = 250
+    height = 200
+
+    def __init__(self, x=0, y=0, name="Scene", content="", id=None):
+        super().__init__(x, y, id)
+        self.name = name
+        self.content = content
+
+
+class ImageBoxModel(ElementModel):
+    __slots__ = ("width", "height", "box_width", "image_path")
+    fields = ("x", "y", "width", "height", "box_width", "image_path")
+
+    def __init__(self, x=0, y=0, width=262, height=75, box_width=200, image_path="", id=None):
+        super().__init__(x, y, id)
+        self.width = width
+        self.height = height
+        self.box_width = box_width
+        self.image_path = image_path
+
+
+ELEMENT_MODELS = {
+    "Note": NoteModel,
+    "Textbox": TextboxModel,
+    "Scene": SceneModel,
+    "ImageBox": ImageBoxModel,
+}
+
+
+def element_from_dict(data):
+    model_class = ELEMENT_MODELS.get(data.get("type"))
+    if model_class is None:
+        return None
+    return model_class.from_dict(data)
+
+
+class LayerModel:
+    __slots__ = ("id", "name", "elements", "offset_x", "offset_y", "zoom")
+
+    def __init__(self, name="Act 1", elements=None, id=None, offset_x=0, offset_y=0, zoom=1.0):
+        self.id = id or new_id()
+        self.name = name
+        self.elements = elements if elements is not None else []
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.zoom = zoom
+
+    def view_dict(self):
+        return {"x": self.offset_x, "y": self.offset_y, "zoom": self.zoom}
+
+    def to_screen(self, x, y):
+        return x * self.zoom + self.offset_x, y * self.zoom + self.offset_y
+
+    def to_world(self, x, y):
+        return (x - self.offset_x) / self.zoom, (y - self.offset_y) / self.zoom
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "view": self.view_dict(),
+            "elements": [element.to_dict() for element in self.elements]
+        }
+
+    @classmethod
+    def from_dict(cls, data, default_name="Act 1"):
+        elements = [element_from_dict(element_data) for element_data in data.get("elements", [])]
+        view = data.get("view", {})
+        return cls(data.get("name", default_name), [element for element in elements if element is not None],
+                   data.get("id"), view.get("x", 0), view.get("y", 0), view.get("zoom", 1.0))
+
+
+class FileModel:
+    __slots__ = ("file_id", "file_name", "layers")
+
+    def __init__(self, file_name="Untitled-1", file_id=None, layers=None):
+        self.file_id = file_id or str(uuid.uuid4())
+        self.file_name = file_name
+        self.layers = layers if layers is not None else []
+
+    def to_dict(self):
+        return {
+            "file_id": self.file_id,
+            "file_name": self.file_name,
+            "layers": [layer.to_dict() for layer in self.layers]
+        }
+
+    @classmethod
+    def from_dict(cls, data, default_name="Untitled-1"):
+        layers = [LayerModel.from_dict(layer_data, f"Act {index}")
+                  for index, layer_data in enumerate(data.get("layers", []), start=1)]
+        return cls(data.get("file_name", default_name), data.get("file_id"), layers)
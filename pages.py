@@ -1,7 +1,33 @@
 from elements import *
 from functions import *
+from model import *
+from tracking import ChangeTracker
+from history import UndoHistory
+from canvas_view import RENDER_MODE, CanvasRenderer
+from spatial import SpatialGrid
+from imaging import read_sizes
+from storage import UNREADABLE, load_layers
+from instrumentation import timed
+
+MIN_ZOOM = 0.1
+MAX_ZOOM = 4.0
+ZOOM_STEP = 1.1
+ROW_HEIGHT = 40
+SEARCH_RESULTS = 8
+IMPORT_WIDTH = 262
+IMPORT_GAP = 20
+import math
 import uuid
 
+# Zoom is always ZOOM_STEP to an integer power, so stepping back always lands on exactly 1.0.
+MIN_ZOOM_STEPS = math.ceil(math.log(MIN_ZOOM, ZOOM_STEP))
+MAX_ZOOM_STEPS = math.floor(math.log(MAX_ZOOM, ZOOM_STEP))
+
+def zoom_steps(zoom):
+    # Also snaps zooms saved by older versions, which drifted off the steps through rounding.
+    steps = round(math.log(zoom, ZOOM_STEP)) if zoom > 0 else 0
+    return min(max(steps, MIN_ZOOM_STEPS), MAX_ZOOM_STEPS)
+
 class MainView(CTkFrame):
     def __init__(self, master, app_state=None, width=200, height=200, **kwargs):
         super().__init__(master, width, height, **kwargs)
@@ -26,6 +52,36 @@ class Page(CTkFrame):
         self.lift()
 
 
+class FileRow(CTkFrame):
+    def __init__(self, master, menu, **kwargs):
+        super().__init__(master, fg_color="light grey", height=ROW_HEIGHT, **kwargs)
+        self.menu = menu
+        self.file_name = None
+
+        self.file_button = CTkButton(self, text="", text_color=get_color(), fg_color="transparent", font=("Arial", 16),
+                                     anchor="w", hover_color="dark grey", command=self.open_file)
+        self.file_button.pack(side=LEFT, fill=X, expand=True)
+
+        delete = load_icon("delete.png", (20, 20))
+        self.delete_button = CTkButton(self, width=30, image=delete, text=None, text_color=get_color(), hover_color="dark grey",
+                                       fg_color="transparent", font=("Arial", 16), command=self.delete_file)
+        self.delete_button.pack(side=RIGHT)
+
+        for widget in (self, self.file_button, self.delete_button):
+            menu.bind_scroll(widget)
+
+    def show_file(self, file_name):
+        if file_name != self.file_name:
+            self.file_name = file_name
+            self.file_button.configure(text=truncate_name(file_name, 30))
+
+    def open_file(self):
+        self.menu.controller.show_page(self.file_name)
+
+    def delete_file(self):
+        self.menu.delete_file(self.file_name)
+
+
 class Menu(Page):
     def __init__(self, master, controller, width=600, height=500, **kwargs):
         super().__init__(master, controller, width=width, height=height, **kwargs)
@@ -33,64 +89,139 @@ class Menu(Page):
         tab = Tab(self, controller, file_parent=None)  
         tab.pack(side=TOP, fill=X)
 
-        self.container = CTkScrollableFrame(self, fg_color="transparent")
-        self.container.pack(side=TOP, fill=BOTH, expand=True)
+        add_file_button = CTkButton(self, fg_color="black", text="Add New File", font=("Arial", 16), 
+                                    command=lambda: self.controller.add_file())
+        add_file_button.pack(side=TOP, fill=X)
 
-        self.container.grid_columnconfigure(0, weight=1)
-        self.container.grid_rowconfigure(0, weight=1)
+        self.search_entry = CTkEntry(self, placeholder_text="Search notes, textboxes and scenes", font=("Arial", 14))
+        self.search_entry.pack(side=TOP, fill=X, pady=(5, 0))
+        self.search_entry.bind("<KeyRelease>", self.on_search)
+        self.search_entry.bind("<Escape>", self.clear_search)
 
-        add_file_button = CTkButton(self.container, fg_color="black", text="Add New File", font=("Arial", 16), 
-                                    command=lambda: self.controller.add_file())
-        add_file_button.grid(row=0, column=0, sticky="news")
+        self.search_results = CTkFrame(self, fg_color="transparent")
+        self.result_buttons = []
+        for _ in range(SEARCH_RESULTS):
+            button = CTkButton(self.search_results, text="", text_color=get_color(), fg_color="transparent", font=("Arial", 14),
+                               anchor="w", hover_color="dark grey")
+            self.result_buttons.append(button)
 
-        self.file_buttons = {}
-        self.file_frames = {}
+        self.scrollbar = CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side=RIGHT, fill=Y)
 
-    def update_file_buttons(self):
-        for frame in self.file_frames.values():
-            frame.destroy()
-        self.file_frames.clear()
+        self.container = CTkFrame(self, fg_color="transparent")
+        self.container.pack(side=TOP, fill=BOTH, expand=True)
+        self.container.bind("<Configure>", self.refresh_rows)
+        self.bind_scroll(self.container)
+
+        # Only enough rows to fill the viewport exist; scrolling re-targets them.
+        self.file_names = []
+        self.rows = []
+        self.first_row = 0
+
+    def on_search(self, event=None):
+        hits = self.controller.search(self.search_entry.get())[:SEARCH_RESULTS]
+        for position, button in enumerate(self.result_buttons):
+            if position < len(hits):
+                file_name, hit = hits[position]
+                button.configure(text=truncate_name(f"{file_name}: {hit['snippet']}", 80),
+                                 command=lambda hit=hit: self.controller.open_hit(hit))
+                button.pack(side=TOP, fill=X)
+            else:
+                button.pack_forget()
 
-        for index, file_name in enumerate(self.controller.get_file_names(), start=1):
-            frame = CTkFrame(self.container, fg_color="light grey")
-            
-            truncated_name = truncate_name(file_name, 30)
-            file_button = CTkButton(frame, text=truncated_name, text_color=get_color(), fg_color="transparent", font=("Arial", 16), 
-                                    anchor="w", hover_color="dark grey", command=lambda name=file_name: self.controller.show_page(name))
-            file_button.pack(side=LEFT, fill=X, expand=True)
+        if hits:
+            self.search_results.pack(side=TOP, fill=X, before=self.scrollbar)
+        else:
+            self.search_results.pack_forget()
 
-            delete = CTkImage(Image.open("images\\delete.png"), size=(20, 20))
-            delete_button = CTkButton(frame, width=30, image=delete, text=None, text_color=get_color(), hover_color="dark grey", fg_color="transparent", font=("Arial", 16),
-                                      command=lambda name=file_name: self.delete_file(name))
-            delete_button.pack(side=RIGHT)
+    def clear_search(self, event=None):
+        self.search_entry.delete(0, END)
+        self.on_search()
 
-            frame.grid(row=index, column=0, sticky="news")
-            self.file_frames[file_name] = frame 
+    def bind_scroll(self, widget):
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, self.on_mouse_wheel)
 
-    def delete_file(self, file_name):
-        if file_name in self.controller.pages:
-            self.controller.pages[file_name].delete_file() 
+    @property
+    def visible_rows(self):
+        height = self.container.winfo_height() / self.container._get_widget_scaling()
+        return max(int(height // ROW_HEIGHT) + 1, 1)
+
+    @timed("Menu.update_file_buttons")
+    def update_file_buttons(self):
+        self.file_names = self.controller.get_file_names()
+        self.refresh_rows()
 
-        if file_name in self.file_frames:
-            self.file_frames[file_name].destroy() 
-            del self.file_frames[file_name]
+    def add_file_button(self, file_name):
+        self.file_names.append(file_name)
+        self.refresh_rows()
 
+    def remove_file_button(self, file_name):
+        if file_name in self.file_names:
+            self.file_names.remove(file_name)
+            self.refresh_rows()
 
     def update_file_button_name(self, old_name, new_name):
-        if old_name in self.file_buttons:
-            button = self.file_buttons.pop(old_name)
-            button.configure(text=new_name)
-            self.file_buttons[new_name] = button
+        if old_name in self.file_names:
+            self.file_names[self.file_names.index(old_name)] = new_name
+            self.refresh_rows()
+
+    def delete_file(self, file_name):
+        self.controller.delete_file(file_name)
+
+    def scroll_to(self, first_row):
+        last_first = max(len(self.file_names) - self.visible_rows + 1, 0)
+        first_row = min(max(int(first_row), 0), last_first)
+        if first_row != self.first_row:
+            self.first_row = first_row
+            self.refresh_rows()
+
+    def on_scrollbar(self, action, value, units=None):
+        if action == "moveto":
+            self.scroll_to(float(value) * len(self.file_names))
+        elif action == "scroll":
+            step = self.visible_rows - 1 if units == "pages" else 1
+            direction = 1 if float(value) > 0 else -1
+            self.scroll_to(self.first_row + direction * step)
+
+    def on_mouse_wheel(self, event):
+        scroll_down = event.num == 5 or event.delta < 0
+        self.scroll_to(self.first_row + (3 if scroll_down else -3))
+
+    @timed("Menu.refresh_rows")
+    def refresh_rows(self, event=None):
+        visible_rows = self.visible_rows
+        while len(self.rows) < visible_rows:
+            self.rows.append(FileRow(self.container, self))
+
+        count = len(self.file_names)
+        self.first_row = min(self.first_row, max(count - visible_rows + 1, 0))
+        for position, row in enumerate(self.rows):
+            index = self.first_row + position
+            if position < visible_rows and index < count:
+                row.show_file(self.file_names[index])
+                row.place(x=0, y=position * ROW_HEIGHT, relwidth=1)
+            else:
+                row.place_forget()
+
+        if count:
+            self.scrollbar.set(self.first_row / count, min((self.first_row + visible_rows) / count, 1))
+        else:
+            self.scrollbar.set(0, 1)
 
 
 class File(Page):
-    def __init__(self, master, controller, file_name="Untitled-1", file_id = None, **kwargs):
+    def __init__(self, master, controller, file_name="Untitled-1", file_id = None, model=None, **kwargs):
         super().__init__(master, controller, **kwargs)
 
-        self.file_id = file_id or str(uuid.uuid4())
-        self.file_name = file_name
+        self.model = model or FileModel(file_name, file_id)
+        self.changes = ChangeTracker(self, self.save_file_state)
+        self.history = UndoHistory()
+        self.history_mode = None
         self.layers = []  
         self.current_layer_index = 0 
+        self.recent_layers = []
+        self.max_live_layers = 3
 
         self.tab = Tab(self, controller, file_parent=self) 
         self.tab.pack(side=TOP, fill=X)
@@ -100,12 +231,28 @@ class File(Page):
 
         self.bind('<Control-S>', command= self.save_file_state)
 
-        if file_id == None:
+        for layer_model in self.model.layers:
+            self.layers.append(Layer(self.layer_container, file_parent=self, model=layer_model))
+
+        if not self.layers:
             self.add_layer(default=True)
 
+    @property
+    def file_id(self):
+        return self.model.file_id
+
+    @property
+    def file_name(self):
+        return self.model.file_name
+
+    @file_name.setter
+    def file_name(self, name):
+        self.model.file_name = name
+
     def add_layer(self, default=False):
-        layer_name = f"Act {len(self.layers) + 1}"
-        new_layer = Layer(self.layer_container, layer_name=layer_name, file_parent=self)
+        layer_model = LayerModel(f"Act {len(self.layers) + 1}")
+        self.model.layers.append(layer_model)
+        new_layer = Layer(self.layer_container, file_parent=self, model=layer_model)
         self.layers.append(new_layer)
 
         if not default:
@@ -116,33 +263,24 @@ class File(Page):
 
         self.update_layer_dropdown()
         self.update_layer_view()
-        self.save_file_state()
-
-    def save_file_state(self):
-        file_data = {
-            "file_id": self.file_id,
-            "file_name": self.file_name,
-            "layers": [
-            {
-                "name": layer.layer_name,
-                "elements": [element.to_dict() for element in layer.winfo_children() if isinstance(element, Selectable)]
-            }
-            for layer in self.layers
-        ]
-        }
+        self.changes.mark(layer_model)
 
-        existing_file = next((file for file in self.controller.app_state["files"] if file["file_id"] == self.file_id), None)
+    @timed("File.save_file_state")
+    def save_file_state(self, event=None):
+        file_data, ops, undo = self.changes.collect(self.model)
+        self.controller.record(ops)
+        self.history.record(undo, self.history_mode)
+
+        existing_file = self.controller.records_by_id.get(self.file_id)
         if existing_file:
             existing_file.update(file_data)
         else:
             self.controller.app_state["files"].append(file_data)
+            self.controller.records_by_id[self.file_id] = file_data
 
     def delete_layer(self):
         if len(self.layers) > 1:
-            layer_to_delete = self.layers[self.current_layer_index]
-            layer_to_delete.pack_forget() 
-            self.layers.remove(layer_to_delete)
-
+            self.discard_layer(self.layers[self.current_layer_index])
 
             if self.current_layer_index >= len(self.layers):
                 self.current_layer_index = len(self.layers) - 1
@@ -150,7 +288,104 @@ class File(Page):
             self.update_layer_dropdown()
             self.update_layer_view()
             
-            self.save_file_state()
+            self.changes.mark()
+
+    def discard_layer(self, layer):
+        layer.pack_forget()
+        self.layers.remove(layer)
+        self.model.layers.remove(layer.model)
+        if layer in self.recent_layers:
+            self.recent_layers.remove(layer)
+        layer.destroy()
+
+    def undo(self, event=None):
+        self.step_history(self.history.pop_undo, "undo")
+
+    def reset_zoom(self):
+        if self.layers:
+            self.layers[self.current_layer_index].reset_zoom()
+
+    def redo(self, event=None):
+        self.step_history(self.history.pop_redo, "redo")
+
+    def step_history(self, pop, mode):
+        self.changes.flush()
+        ops = pop()
+        if not ops:
+            return
+        self.apply_history(ops)
+
+        # The changes made here come back from the tracker as the opposite entry.
+        self.history_mode = mode
+        try:
+            self.changes.flush()
+        finally:
+            self.history_mode = None
+
+    def apply_history(self, ops):
+        current_layer = self.layers[self.current_layer_index]
+        layers = {layer.model.id: layer for layer in self.layers}
+        element_maps = {}
+        touched = set()
+
+        for op in ops:
+            kind = op["op"]
+            if kind == "add_layer":
+                layer_model = LayerModel.from_dict(op["data"])
+                index = min(op["index"], len(self.layers))
+                self.model.layers.insert(index, layer_model)
+                layer = layers[layer_model.id] = Layer(self.layer_container, file_parent=self, model=layer_model)
+                self.layers.insert(index, layer)
+                self.changes.mark(layer_model)
+                continue
+
+            layer = layers.get(op["layer"])
+            if layer is None:
+                continue
+            if kind == "delete_layer":
+                if len(self.layers) > 1:
+                    del layers[op["layer"]]
+                    self.discard_layer(layer)
+                    self.changes.mark()
+                continue
+            if kind == "rename_layer":
+                layer.layer_name = op["name"]
+                self.changes.mark(layer.model)
+                continue
+
+            if layer not in element_maps:
+                element_maps[layer] = {model.id: model for model in layer.model.elements}
+            elements = element_maps[layer]
+            touched.add(layer)
+
+            if kind == "add_element":
+                element_model = element_from_dict(op["data"])
+                if element_model is not None:
+                    layer.model.elements.insert(op.get("index", len(layer.model.elements)), element_model)
+                    elements[element_model.id] = element_model
+                    layer.mark_dirty(element_model)
+            elif kind == "update_element":
+                element_model = elements.get(op["element"])
+                if element_model is not None:
+                    for field, value in op["data"].items():
+                        if field in element_model.fields:
+                            setattr(element_model, field, value)
+                    layer.mark_dirty(element_model)
+            elif kind == "delete_element":
+                element_model = elements.pop(op["element"], None)
+                if element_model is not None:
+                    layer.remove_model(element_model)
+
+        for layer in touched:
+            if layer in self.layers:
+                layer.reload()
+
+        if current_layer in self.layers:
+            self.current_layer_index = self.layers.index(current_layer)
+        else:
+            self.current_layer_index = min(self.current_layer_index, len(self.layers) - 1)
+        self.update_layer_dropdown()
+        self.update_layer_view()
 
     def update_layer_dropdown(self):
         layer_names = [layer.layer_name for layer in self.layers]
@@ -163,21 +398,38 @@ class File(Page):
                 self.switch_to_layer(index)
                 break
 
+    def jump_to(self, layer_id, element_id):
+        for index, layer in enumerate(self.layers):
+            if layer.model.id == layer_id:
+                self.switch_to_layer(index)
+                layer.focus_element(element_id)
+                break
+
     def switch_to_layer(self, index):
         if 0 <= index < len(self.layers):
             self.layers[self.current_layer_index].pack_forget()
             self.current_layer_index = index
-            self.layers[self.current_layer_index].pack(fill=BOTH, expand=True)
+            self.show_layer(self.layers[self.current_layer_index])
 
         self.tab.layer_dropdown_var.set(self.layers[self.current_layer_index].layer_name)
 
     def update_layer_view(self):
         for i, layer in enumerate(self.layers):
             if i == self.current_layer_index:
-                layer.pack(fill=BOTH, expand=True)
+                self.show_layer(layer)
             else:
                 layer.pack_forget()
 
+    def show_layer(self, layer):
+        layer.materialize()
+        layer.pack(fill=BOTH, expand=True)
+
+        if layer in self.recent_layers:
+            self.recent_layers.remove(layer)
+        self.recent_layers.append(layer)
+        while len(self.recent_layers) > self.max_live_layers:
+            self.recent_layers.pop(0).dematerialize()
+
     def rename_layer(self):
         current_layer = self.layers[self.current_layer_index]
         dialogue = CTkInputDialog(title="Rename Layer", text="Enter new layer name:")
@@ -185,7 +437,7 @@ class File(Page):
         if new_name:
             current_layer.layer_name = new_name
             self.update_layer_dropdown()
-            self.save_file_state()
+            self.changes.mark(current_layer.model)
 
     def rename_file(self, new_name):
         old_name = self.file_name
@@ -194,67 +446,276 @@ class File(Page):
 
         self.controller.rename_file_in_controller(old_name, new_name)
 
-        self.save_file_state()
+        self.changes.mark()
 
     def delete_file(self):
         if self.file_name in self.controller.pages:
             del self.controller.pages[self.file_name]
+        self.controller.file_records.pop(self.file_name, None)
+        self.controller.records_by_id.pop(self.file_id, None)
 
+        self.changes.cancel()
+        self.history.close()
+        self.controller.record([{"op": "delete_file", "file": self.file_id}])
         self.controller.app_state["files"] = [
             file for file in self.controller.app_state["files"] 
             if file["file_id"] != self.file_id
         ]
 
-        menu_page = self.controller.pages["menu"]
-        menu_page.update_file_buttons()
+        self.controller.pages["menu"].remove_file_button(self.file_name)
 
         self.destroy()
 
 class Layer(CTkFrame):
-    def __init__(self, master, layer_name="Layer", file_parent=None, **kwargs):
+    def __init__(self, master, layer_name="Layer", file_parent=None, model=None, **kwargs):
         super().__init__(master, **kwargs)
 
-        self.layer_name = layer_name
+        self.model = model or LayerModel(layer_name)
+        self.model.zoom = ZOOM_STEP ** zoom_steps(self.model.zoom)
         self.file_parent = file_parent  
         self.elements = []
         self.current_scene_index = 0
         self.is_dragging = False 
         self.drag_start_position = {"x": 0, "y": 0}
+        self.toolbar = None
+        self.renderer = None
+        self.viewport_margin = 300
+        self._visible_update = None
 
-        self.toolbar = Toolbar(self)
-        self.toolbar.place(x=35, rely=0.55, anchor="center")
+        self.index = SpatialGrid()
+        self.index.rebuild(self.model.elements)
 
         self.bind("<Button-1>", self.click)
-        self.bind("<B1-Motion>", self.do_drag)
+        self.drag_motion = MotionCoalescer(self, self.do_drag)
+        self.bind("<B1-Motion>", self.drag_motion)
         self.bind("<ButtonRelease-1>", self.stop_drag)
+        self.bind("<Configure>", self.schedule_visible_update)
+        for sequence in ("<Control-MouseWheel>", "<Control-Button-4>", "<Control-Button-5>"):
+            self.bind(sequence, self.on_zoom_wheel)
+
+    @property
+    def layer_name(self):
+        return self.model.name
+
+    @layer_name.setter
+    def layer_name(self, name):
+        self.model.name = name
+
+    @property
+    def materialized(self):
+        return self.toolbar is not None
+
+    @property
+    def needs_canvas(self):
+        # Widgets cannot be scaled, so any zoom other than 1 is drawn on the canvas.
+        return RENDER_MODE == "canvas" or self.model.zoom != 1
+
+    def materialize(self):
+        if self.materialized:
+            return
+        self.toolbar = Toolbar(self)
+        self.toolbar.place(x=35, rely=0.55, anchor="center")
+        if self.needs_canvas:
+            self.attach_renderer()
+        self.load_elements()
+
+    def attach_renderer(self):
+        self.renderer = CanvasRenderer(self)
+        self.renderer.lower_below(self.toolbar)
+
+    def detach_renderer(self):
+        self.renderer.commit_edit()
+        self.renderer.destroy()
+        self.renderer = None
+
+    def clear_widgets(self):
+        if Selectable.selected_object in self.elements:
+            Selectable.selected_object = None
+        for element in self.elements:
+            element.destroy()
+        self.elements = []
+
+    def dematerialize(self):
+        if not self.materialized:
+            return
+        if self._visible_update is not None:
+            self.after_cancel(self._visible_update)
+            self._visible_update = None
+        self.clear_widgets()
+        self.current_scene_index = 0
+
+        if self.renderer is not None:
+            self.renderer.editing = None
+            self.renderer.destroy()
+            self.renderer = None
+
+        self.toolbar.note_option.destroy()
+        self.toolbar.image_option.destroy()
+        self.toolbar.destroy()
+        self.toolbar = None
+
+    def reload(self):
+        if not self.materialized:
+            return
+        if self.renderer is not None:
+            self.renderer.commit_edit()
+            self.renderer.selected = None
+            self.renderer.clear()
+        self.clear_widgets()
+        self.load_elements()
+
+    def load_elements(self):
+        self.current_scene_index = sum(isinstance(model, SceneModel) for model in self.model.elements)
+        self.update_visible()
+
+    def view_size(self):
+        scaling = self._get_widget_scaling()
+        width = self.winfo_width() / scaling
+        height = self.winfo_height() / scaling
+        if width <= 1 or height <= 1:
+            width, height = 1920, 1080
+        return width, height
+
+    def viewport(self):
+        width, height = self.view_size()
+        margin = self.viewport_margin
+        x0, y0 = self.model.to_world(-margin, -margin)
+        x1, y1 = self.model.to_world(width + margin, height + margin)
+        return (x0, y0, x1, y1)
+
+    def schedule_visible_update(self, event=None):
+        if self._visible_update is None and self.materialized:
+            self._visible_update = self.after_idle(self.update_visible)
+
+    def update_visible(self):
+        self._visible_update = None
+        if not self.materialized:
+            return
+        visible = self.index.query(*self.viewport())
+
+        if self.renderer is not None:
+            self.renderer.sync(visible)
+            self.toolbar.lift()
+            return
+
+        for element in list(self.elements):
+            if element.model not in visible and element is not Selectable.selected_object:
+                self.elements.remove(element)
+                element.destroy()
+
+        mounted = {element.model for element in self.elements}
+        for element_model in self.index.in_order(visible):
+            if element_model not in mounted:
+                element = create_element(self, element_model)
+                if element:
+                    self.mount_element(element)
+        self.toolbar.lift()
+
+    def element_at(self, x, y):
+        return self.index.hit(x, y)
+
+    def focus_element(self, element_id):
+        element_model = next((model for model in self.model.elements if model.id == element_id), None)
+        if element_model is None:
+            return
+
+        width, height = self.view_size()
+        x, y = self.model.to_screen(element_model.x + element_model.width / 2,
+                                    element_model.y + element_model.height / 2)
+        self.pan(width / 2 - x, height / 2 - y)
+        self.mark_dirty()
+        self.update_visible()
+
+        if self.renderer is not None:
+            self.renderer.select(element_model)
+            return
+        for element in self.elements:
+            if element.model is element_model:
+                element.select()
+                break
     
     def add_element(self, element, x=150, y=150):
         if isinstance(element, Scene):
             self.current_scene_index += 1
-            scene_name = f"Scene {self.current_scene_index}"
-            element.name = scene_name
-            element.title.delete("1.0", "end")
-            element.title.insert("1.0", element.name)
+            element.set_name(f"Scene {self.current_scene_index}")
 
-        self.elements.append(element)
-        element.place(x=x - 14, y=y)
+        element.model.x, element.model.y = self.model.to_world(x - 14, y)
+        self.model.elements.append(element.model)
+        self.mount_element(element)
+        if self.renderer is not None:
+            self.renderer.begin_edit(element)
+
+        self.mark_dirty(element.model)
 
+    def add_images(self, image_paths, x=150, y=150):
+        sizes = read_sizes(image_paths)
+        images = [(image_path, size) for image_path, size in zip(image_paths, sizes) if size and min(size) > 0]
+        if not images:
+            return
+
+        # Lay the images out in a roughly square grid of equal-width cells, rows as tall as their tallest image.
+        columns = math.ceil(math.sqrt(len(images)))
+        origin_x, top = self.model.to_world(x - 14, y)
+        for row_start in range(0, len(images), columns):
+            left = origin_x
+            row_height = 0
+            for image_path, (width, height) in images[row_start:row_start + columns]:
+                element_model = ImageBoxModel(left, top, IMPORT_WIDTH, int(IMPORT_WIDTH * height / width),
+                                              image_path=image_path)
+                self.model.elements.append(element_model)
+                self.mark_dirty(element_model)
+                left += IMPORT_WIDTH + IMPORT_GAP
+                row_height = max(row_height, element_model.height)
+            top += row_height + IMPORT_GAP
+
+        # One save and one undo step for the whole batch; only the visible images get mounted and decoded.
         self.file_parent.save_file_state()
+        self.update_visible()
+
+    def mount_element(self, element):
+        self.elements.append(element)
+        self.place_element(element)
+
+    def place_element(self, element):
+        x, y = self.model.to_screen(element.model.x, element.model.y)
+        element.place(x=x, y=y)
+
+    def remove_element(self, element):
+        if element in self.elements:
+            self.elements.remove(element)
+        if self.renderer is not None and self.renderer.editing is element:
+            self.renderer.editing = None
+        self.remove_model(element.model)
+
+    def remove_model(self, element_model):
+        if element_model in self.model.elements:
+            self.model.elements.remove(element_model)
+        self.index.remove(element_model)
+        self.file_parent.changes.discard(element_model)
+        self.mark_dirty()
+
+    def mark_dirty(self, element_model=None):
+        if element_model is not None and element_model in self.model.elements:
+            self.index.update(element_model)
+        self.file_parent.changes.mark(self.model, element_model)
     
     def to_dict(self):
-        return {
-            "name": self.layer_name,
-            "elements": [element.to_dict() for element in self.elements]
-        }
+        return self.model.to_dict()
     
     def click(self, event):
-        self.toolbar.note_option.place_forget()
+        # One handler for the whole layer: elements are created and destroyed by culling all the time.
+        selected = Selectable.selected_object
+        if selected is not None and selected in self.elements:
+            selected.deselect()
+        if self.toolbar is not None:
+            self.toolbar.hide_options()
         self.start_drag(event)
 
     def start_drag(self, event):
         if self.is_dragging:
             self.drag_start_position = {"x": event.x_root, "y": event.y_root}
 
+    @timed("Layer.do_drag")
     def do_drag(self, event):
         if not self.is_dragging:
             return
@@ -262,24 +723,61 @@ class Layer(CTkFrame):
         dx = event.x_root - self.drag_start_position["x"]
         dy = event.y_root - self.drag_start_position["y"]
 
-        for element in self.elements:
-            current_x = (element.winfo_x() + dx) * 0.80
-            current_y = (element.winfo_y() + dy) * 0.80
-            element.place(x=current_x, y=current_y)
+        scaling = self._get_widget_scaling()
+        self.pan(dx / scaling, dy / scaling)
 
         self.drag_start_position["x"] = event.x_root
         self.drag_start_position["y"] = event.y_root
 
+    def pan(self, dx, dy):
+        self.model.offset_x += dx
+        self.model.offset_y += dy
+        if self.renderer is not None:
+            self.renderer.pan(dx, dy)
+        for element in self.elements:
+            self.place_element(element)
+        self.schedule_visible_update()
+
     def stop_drag(self, event):
+        self.drag_motion.flush()
         if self.is_dragging:
-            self.file_parent.save_file_state()
-
-    
-    def to_dict(self):
-        return {
-            "name": self.layer_name,
-            "elements": [element.to_dict() for element in self.elements]
-        }
+            self.mark_dirty()
+
+    def on_zoom_wheel(self, event):
+        zoom_in = event.num == 4 or event.delta > 0
+        scaling = self._get_widget_scaling()
+        self.zoom_at(1 if zoom_in else -1, event.x / scaling, event.y / scaling)
+
+    def reset_zoom(self):
+        width, height = self.view_size()
+        self.zoom_at(-zoom_steps(self.model.zoom), width / 2, height / 2)
+
+    def zoom_at(self, steps, x, y):
+        model = self.model
+        steps = min(max(zoom_steps(model.zoom) + steps, MIN_ZOOM_STEPS), MAX_ZOOM_STEPS)
+        zoom = ZOOM_STEP ** steps
+        if zoom == model.zoom:
+            return
+        world_x, world_y = model.to_world(x, y)
+        model.zoom = zoom
+        model.offset_x = x - world_x * zoom
+        model.offset_y = y - world_y * zoom
+        self.refresh_view()
+        self.mark_dirty()
+
+    def refresh_view(self):
+        if not self.materialized:
+            return
+        if self.needs_canvas and self.renderer is None:
+            self.clear_widgets()
+            self.attach_renderer()
+        elif not self.needs_canvas and self.renderer is not None:
+            self.detach_renderer()
+        elif self.renderer is not None:
+            self.renderer.clear()
+        for element in self.elements:
+            self.place_element(element)
+        self.update_visible()
 
 class PageController:
     def __init__(self, container, parent, app_state=None):
@@ -287,6 +785,10 @@ class PageController:
         self.app_state = app_state
         self.container = container
         self.pages = {}
+        self.file_records = {}
+        self.records_by_id = {}
+        self.name_counters = {}
+        self.current_page = None
 
         self.pages["menu"] = Menu(container, self)
         self.pages["menu"].grid(row=0, column=0, sticky="nsew")
@@ -299,10 +801,46 @@ class PageController:
             pass
 
     def show_page(self, page_name):
-        if page_name in self.pages:
-            self.pages[page_name].lift()
-        else:
-            self.pages["menu"].lift()
+        if page_name not in self.pages and page_name in self.file_records:
+            self.build_file(page_name)
+
+        if page_name not in self.pages:
+            page_name = "menu"
+        self.current_page = self.pages[page_name]
+        self.current_page.lift()
+
+    def undo(self, event=None):
+        if isinstance(self.current_page, File):
+            self.current_page.undo()
+
+    def redo(self, event=None):
+        if isinstance(self.current_page, File):
+            self.current_page.redo()
+
+    def reset_zoom(self, event=None):
+        if isinstance(self.current_page, File):
+            self.current_page.reset_zoom()
+
+    def build_file(self, file_name):
+        file_data = self.file_records[file_name]
+        # Storyboards are read from storage on first open, not at startup.
+        load_layers(file_data)
+        if UNREADABLE in file_data:
+            # Opening it empty would let the next save replace what may still be recovered.
+            self.parent.show_notice(f"{file_name} could not be read and was not opened: {file_data[UNREADABLE]}")
+            return None
+        model = FileModel.from_dict(file_data, file_name)
+
+        new_file = File(self.container, self, model=model)
+        new_file.changes.prime(file_data)
+        new_file.switch_to_layer(0)
+
+        self.pages[file_name] = new_file
+        new_file.grid(row=0, column=0, sticky="nsew")
+
+        new_file.update_layer_view()
+        new_file.update_layer_dropdown()
+        return new_file
 
     def add_file(self):
         self.file_count += 1
@@ -311,102 +849,84 @@ class PageController:
         new_file = File(self.container, self, file_name=file_name)
         self.pages[file_name] = new_file
         new_file.grid(row=0, column=0, sticky="nsew")
+        new_file.save_file_state()
+        self.file_records[file_name] = self.records_by_id[new_file.file_id]
 
-        self.pages["menu"].update_file_buttons()
+        self.pages["menu"].add_file_button(file_name)
 
         self.show_page(file_name)
 
     def generate_unique_file_name(self, base_name):
-        existing_names = self.get_file_names()
-        if base_name not in existing_names:
+        if base_name not in self.file_records:
             return base_name
-        counter = 1
-        unique_name = f"{base_name}_{counter}"
-        while unique_name in existing_names:
+        # Resume from the last suffix handed out for this base instead of rescanning from 1.
+        counter = self.name_counters.get(base_name, 0) + 1
+        while f"{base_name}_{counter}" in self.file_records:
             counter += 1
-            unique_name = f"{base_name}_{counter}"
-        return unique_name
+        self.name_counters[base_name] = counter
+        return f"{base_name}_{counter}"
 
     def delete_file(self, file_name):
         if file_name in self.pages:
-            file_page = self.pages.pop(file_name)
-
+            self.pages[file_name].delete_file()
+        elif file_name in self.file_records:
+            file_data = self.file_records.pop(file_name)
+            self.records_by_id.pop(file_data["file_id"], None)
+            self.record([{"op": "delete_file", "file": file_data["file_id"]}])
+            self.app_state["files"] = [file for file in self.app_state["files"] if file is not file_data]
 
-            menu_page = self.pages["menu"]
-            menu_page.update_file_buttons()
+            self.pages["menu"].remove_file_button(file_name)
 
     def get_file_names(self):
-        return [page.file_name for page in self.pages.values() if isinstance(page, File)]
+        return list(self.file_records)
 
     
     def rename_file_in_controller(self, old_name, new_name):
         if old_name in self.pages:
             self.pages[new_name] = self.pages.pop(old_name)
             self.pages[new_name].file_name = new_name
+            self.file_records[new_name] = self.file_records.pop(old_name)
 
-            menu_page = self.pages["menu"]
-            menu_page.update_file_button_name(old_name, new_name)
-            menu_page.update_file_buttons() 
+            self.pages["menu"].update_file_button_name(old_name, new_name)
+
+    def record(self, ops):
+        if ops:
+            self.parent.record_ops(ops)
+
+    def search(self, text):
+        hits = []
+        for hit in self.parent.search_index.query(text):
+            record = self.records_by_id.get(hit["file_id"])
+            if record is not None:
+                hits.append((record["file_name"], hit))
+        return hits
+
+    def open_hit(self, hit):
+        record = self.records_by_id.get(hit["file_id"])
+        if record is None:
+            return
+        self.show_page(record["file_name"])
+        page = self.pages.get(record["file_name"])
+        if isinstance(page, File):
+            page.jump_to(hit["layer_id"], hit["element_id"])
+
+    def flush_files(self):
+        for page in self.pages.values():
+            if isinstance(page, File):
+                page.changes.flush()
 
     def save_and_quit(self):
         self.parent.save_state()
         self.container.quit()
 
+    @timed("PageController.load_files")
     def load_files(self):
-        file_num = []
         for file_data in self.app_state.get("files", []):
-            file_name = file_data.get("file_name", f"Untitled-{self.file_count + 1}")
-            file_id = file_data.get("file_id", str(uuid.uuid4()))
-            layers = file_data.get("layers", [])
-
-            file_num.append((file_name, file_id, layers))
-
-        for file in file_num:
-            new_file = File(self.container, self, file_name=file[0], file_id=file[1])
-            self.pages[file[0]] = new_file
-
-            new_file.layers = []
-            for layer_data in file[2]:
-                layer_name = layer_data.get("name", f"Act {len(new_file.layers) + 1}")
-                new_layer = Layer(new_file.layer_container, layer_name=layer_name, file_parent=new_file)
-                new_file.layers.append(new_layer)
-
-                elements = layer_data.get("elements", [])
-                for element_data in elements:
-                    element_class = globals().get(element_data.get("type"))
-                    if element_class and issubclass(element_class, Selectable):
-                        if issubclass(element_class, Note):
-                            color = element_data.get("color", "#ffd60a")
-                            element = element_class(new_layer, width = 200, height = 200)
-                            element.set_content(element_data.get("content", ""), color=color)
-                            new_layer.add_element(element, x = element_data["x"], y = element_data["y"])
-                        elif issubclass(element_class, Textbox):
-                            element = element_class(new_layer, width = element_data["width"], height = element_data["height"], 
-                                                    box_width=element_data["box_width"], box_height=element_data["box_height"], 
-                                                    font_size=element_data["font_size"])
-                            element.set_content(element_data.get("content", ""))
-                            new_layer.add_element(element, x = element_data["x"], y = element_data["y"])
-                        elif issubclass(element_class, Scene):
-                            element = element_class(new_layer)
-                            new_layer.add_element(element, x = element_data["x"], y = element_data["y"])
-                            element.set_content(element_data.get("content", ""), element_data["name"])
-                        elif issubclass(element_class, ImageBox):
-                            if os.path.exists(element_data["image_path"]):
-                                element = element_class(new_layer, box_width=element_data["box_width"], image_path=element_data["image_path"])
-                                element.set_content(element_data.get("content", ""))
-                                new_layer.add_element(element, x = element_data["x"], y = element_data["y"])
-                new_layer.toolbar.lift()
-                        
-            if new_file.layers:
-                new_file.switch_to_layer(0)
-
-            self.pages[file[0]] = new_file
-            new_file.grid(row=0, column=0, sticky="nsew")
+            file_name = file_data.setdefault("file_name", f"Untitled-{self.file_count + 1}")
+            self.file_records[file_name] = file_data
+            self.records_by_id[file_data["file_id"]] = file_data
             self.file_count += 1
 
-            new_file.update_layer_view()
-            new_file.update_layer_dropdown()
-
         self.pages["menu"].update_file_buttons()
 
 class Tab(CTkFrame):
@@ -416,7 +936,7 @@ class Tab(CTkFrame):
         self.controller = controller
         self.file_parent = file_parent
         
-        iconhome = CTkImage(Image.open("images\\home.png"), size=(20, 20))
+        iconhome = load_icon("home.png", (20, 20))
         home = CTkButton(self, image=iconhome, text=None, text_color=get_color(), width=60, height=40,
                          corner_radius=0, fg_color="transparent", hover_color="dark grey", command=self.on_home_button_click)
         home.pack(side=LEFT)
@@ -427,7 +947,7 @@ class Tab(CTkFrame):
                                         fg_color="transparent", hover_color="dark grey",command=self.on_title_button_click)
             self.title_button.pack(side=LEFT, padx=10)
 
-        iconsetting = CTkImage(Image.open("images\\setting.png"), size=(20, 20))
+        iconsetting = load_icon("setting.png", (20, 20))
         setting = CTkButton(self, image=iconsetting, text=None, text_color=get_color(), width=60, height=40,
                          corner_radius=0, fg_color="transparent", hover_color="dark grey", command=self.open_settings)
         setting.pack(side=RIGHT)
@@ -450,12 +970,12 @@ class Tab(CTkFrame):
                                          hover_color="dark grey", command=self.add_layer)
             add_layer_button.pack(side=RIGHT)
 
-            delete = CTkImage(Image.open("images\\delete.png"), size=(20, 20))
+            delete = load_icon("delete.png", (20, 20))
             delete_layer_button = CTkButton(self, image=delete, text=None, text_color=get_color(), font=("Arial", 16), width= 30, 
                                             fg_color="transparent", hover_color="dark grey", command=self.delete_layer)
             delete_layer_button.pack(side=RIGHT)
 
-            rename = CTkImage(Image.open("images\\Rename.png"), size=(20, 20))
+            rename = load_icon("Rename.png", (20, 20))
             rename_layer_button = CTkButton(self, image=rename, text=None, text_color=get_color(), font=("Arial", 16), width= 30, 
                                             fg_color="transparent", hover_color="dark grey",
                                             command=self.rename_layer)
@@ -494,4 +1014,3 @@ class Tab(CTkFrame):
             self.file_parent.rename_file(new_name)
             truncated_name = truncate_name(new_name)
             self.title_button.configure(text=truncated_name)
-            self.controller.pages["menu"].update_file_buttons()
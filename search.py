@@ -0,0 +1,243 @@
+import bisect
+import heapq
+import json
+import re
+import threading
+
+from storage import read_layers, write_atomic
+
+INDEX_PATH = "search_index.json"
+INDEX_VERSION = 1
+
+TEXT_FIELDS = {
+    "Note": ("content",),
+    "Textbox": ("content",),
+    "Scene": ("name", "content"),
+}
+
+SNIPPET_LENGTH = 60
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+class SearchIndex:
+    def __init__(self):
+        self.entries = {}
+        self.postings = {}
+        self.layers = {}
+        self.files = {}
+        self.dirty = False
+        self._vocabulary = None
+
+    @classmethod
+    def build(cls, app_state):
+        index = cls()
+        for file in app_state.get("files", []):
+            index.add_file(file)
+        index.dirty = True
+        return index
+
+    def add_file(self, file):
+        self.remove_file(file["file_id"])
+        for layer in read_layers(file):
+            self.add_layer(file["file_id"], layer)
+
+    def remove_file(self, file_id):
+        for layer_id in self.files.pop(file_id, ()):
+            self.remove_layer(layer_id)
+
+    def add_layer(self, file_id, layer):
+        self.files.setdefault(file_id, set()).add(layer["id"])
+        self.layers.setdefault(layer["id"], set())
+        for element in layer.get("elements", []):
+            self.add_element(file_id, layer["id"], element)
+
+    def remove_layer(self, layer_id):
+        for element_id in list(self.layers.pop(layer_id, ())):
+            self.remove_element(element_id)
+
+    def add_element(self, file_id, layer_id, element):
+        fields = TEXT_FIELDS.get(element.get("type"))
+        if not fields:
+            return
+        texts = {field: element.get(field) or "" for field in fields}
+        self.set_entry(element["id"], file_id, layer_id, texts)
+
+    def update_element(self, element_id, data):
+        entry = self.entries.get(element_id)
+        if entry is None:
+            return
+        file_id, layer_id, fields = entry
+        changed = [field for field in fields if field in data]
+        if not changed:
+            return
+        texts = {field: snippet for field, (_, snippet) in fields.items()}
+        texts.update({field: data[field] or "" for field in changed})
+        # Snippets are truncated, so only the changed fields are re-tokenized from full text.
+        tokens = {field: fields[field][0] for field in fields if field not in changed}
+        self.set_entry(element_id, file_id, layer_id, texts, tokens)
+
+    def set_entry(self, element_id, file_id, layer_id, texts, tokens=None):
+        self.remove_element(element_id)
+        tokens = tokens or {}
+        fields = {}
+        for field, text in texts.items():
+            # Tokens are kept as one space-separated string: far fewer objects to hold, save and load.
+            field_tokens = tokens.get(field)
+            if field_tokens is None:
+                field_tokens = " ".join(sorted(set(tokenize(text))))
+            fields[field] = (field_tokens, text[:SNIPPET_LENGTH])
+            self.add_postings(element_id, field_tokens.split())
+        self.entries[element_id] = (file_id, layer_id, fields)
+        self.files.setdefault(file_id, set()).add(layer_id)
+        self.layers.setdefault(layer_id, set()).add(element_id)
+        self.dirty = True
+
+    def add_postings(self, element_id, tokens):
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = set()
+                self._vocabulary = None
+            posting.add(element_id)
+
+    def remove_element(self, element_id):
+        entry = self.entries.pop(element_id, None)
+        if entry is None:
+            return
+        file_id, layer_id, fields = entry
+        for field_tokens, _ in fields.values():
+            for token in field_tokens.split():
+                posting = self.postings.get(token)
+                if posting is not None:
+                    posting.discard(element_id)
+                    if not posting:
+                        del self.postings[token]
+                        self._vocabulary = None
+        self.layers.get(layer_id, set()).discard(element_id)
+        self.dirty = True
+
+    def apply_ops(self, ops):
+        for op in ops:
+            self.apply_op(op)
+
+    def apply_op(self, op):
+        kind = op["op"]
+        if kind == "add_file":
+            self.add_file(op["data"])
+        elif kind == "delete_file":
+            self.remove_file(op["file"])
+        elif kind == "add_layer":
+            self.add_layer(op["file"], op["data"])
+        elif kind == "delete_layer":
+            self.files.get(op["file"], set()).discard(op["layer"])
+            self.remove_layer(op["layer"])
+        elif kind == "add_element":
+            self.add_element(op["file"], op["layer"], op["data"])
+        elif kind == "update_element":
+            self.update_element(op["element"], op["data"])
+        elif kind == "delete_element":
+            self.remove_element(op["element"])
+
+    def matching(self, token, prefix=False):
+        if not prefix:
+            return self.postings.get(token, set())
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        found = set()
+        position = bisect.bisect_left(vocabulary, token)
+        while position < len(vocabulary) and vocabulary[position].startswith(token):
+            found |= self.postings[vocabulary[position]]
+            position += 1
+        return found
+
+    def query(self, text, limit=50):
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        # The last word is still being typed, so it matches as a prefix.
+        candidates = [self.matching(token) for token in tokens[:-1]]
+        candidates.append(self.matching(tokens[-1], prefix=True))
+        candidates.sort(key=len)
+        found = set(candidates[0])
+        for other in candidates[1:]:
+            found &= other
+            if not found:
+                return []
+
+        entries = self.entries
+        hits = []
+        for element_id in heapq.nsmallest(limit, found, key=lambda element_id: (entries[element_id][0], element_id)):
+            file_id, layer_id, fields = entries[element_id]
+            snippet = " - ".join(snippet for _, snippet in fields.values() if snippet)
+            hits.append({"file_id": file_id, "layer_id": layer_id, "element_id": element_id, "snippet": snippet})
+        return hits
+
+    def snapshot(self):
+        # Entries are replaced rather than mutated, so a shallow copy is safe to hand to another thread.
+        self.dirty = False
+        return dict(self.entries)
+
+
+class IndexBuild(threading.Thread):
+    # Rebuilds a missing or stale index from a copied app_state off the Tk thread. Ops recorded
+    # meanwhile are collected here and applied to the finished index.
+    def __init__(self, app_state):
+        super().__init__(name="search-index", daemon=True)
+        self.app_state = app_state
+        self.index = None
+        self.ops = []
+        self.start()
+
+    def run(self):
+        self.index = SearchIndex.build(self.app_state)
+
+    def finish(self):
+        self.join()
+        index = self.index or SearchIndex()
+        index.apply_ops(self.ops)
+        return index
+
+
+def dump_index(path, seq, entries):
+    # Postings are stored as positions into the element list so loading needs no re-indexing.
+    positions = {}
+    postings = {}
+    elements = []
+    for position, (element_id, (file_id, layer_id, fields)) in enumerate(entries.items()):
+        positions[element_id] = position
+        elements.append([element_id, file_id, layer_id, fields])
+        for field_tokens, _ in fields.values():
+            for token in field_tokens.split():
+                postings.setdefault(token, []).append(position)
+
+    data = {"version": INDEX_VERSION, "seq": seq, "elements": elements, "postings": postings}
+    write_atomic(path, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def load_index(path, app_state):
+    seq = app_state.get("journal_seq", 0)
+    try:
+        with open(path, "rb") as f:
+            data = json.loads(f.read())
+    except (OSError, ValueError):
+        data = None
+
+    if not data or data.get("version") != INDEX_VERSION or data.get("seq") != seq:
+        return None
+
+    index = SearchIndex()
+    element_ids = []
+    for element_id, file_id, layer_id, fields in data["elements"]:
+        element_ids.append(element_id)
+        index.entries[element_id] = (file_id, layer_id, fields)
+        index.files.setdefault(file_id, set()).add(layer_id)
+        index.layers.setdefault(layer_id, set()).add(element_id)
+    lookup = element_ids.__getitem__
+    index.postings = {token: set(map(lookup, positions)) for token, positions in data["postings"].items()}
+    return index
@@ -0,0 +1,95 @@
+import itertools
+
+CELL_SIZE = 256
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.bounds = {}
+        self.order = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def __contains__(self, model):
+        return model in self.bounds
+
+    def cell_range(self, x0, y0, x1, y1):
+        size = self.cell_size
+        return (range(int(x0 // size), int(x1 // size) + 1),
+                range(int(y0 // size), int(y1 // size) + 1))
+
+    def insert(self, model):
+        box = (model.x, model.y, model.x + model.width, model.y + model.height)
+        self.bounds[model] = box
+        if model not in self.order:
+            self.order[model] = next(self._counter)
+        columns, rows = self.cell_range(*box)
+        for cx in columns:
+            for cy in rows:
+                self.cells.setdefault((cx, cy), set()).add(model)
+
+    def remove(self, model):
+        box = self.bounds.pop(model, None)
+        if box is None:
+            return
+        self.order.pop(model, None)
+        columns, rows = self.cell_range(*box)
+        for cx in columns:
+            for cy in rows:
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(model)
+                    if not cell:
+                        del self.cells[(cx, cy)]
+
+    def update(self, model):
+        box = (model.x, model.y, model.x + model.width, model.y + model.height)
+        if self.bounds.get(model) == box:
+            return
+        order = self.order.get(model)
+        self.remove(model)
+        self.insert(model)
+        if order is not None:
+            self.order[model] = order
+
+    def raise_to_top(self, model):
+        if model in self.order:
+            self.order[model] = next(self._counter)
+
+    def rebuild(self, models):
+        self.cells.clear()
+        self.bounds.clear()
+        self.order.clear()
+        for model in models:
+            self.insert(model)
+
+    def query(self, x0, y0, x1, y1):
+        found = set()
+        columns, rows = self.cell_range(x0, y0, x1, y1)
+        cells = self.cells
+        if len(columns) * len(rows) > len(cells):
+            candidates = itertools.chain.from_iterable(
+                cell for (cx, cy), cell in cells.items() if cx in columns and cy in rows)
+        else:
+            candidates = itertools.chain.from_iterable(
+                cells.get((cx, cy), ()) for cx in columns for cy in rows)
+        for model in candidates:
+            if model in found:
+                continue
+            bx0, by0, bx1, by1 = self.bounds[model]
+            if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                found.add(model)
+        return found
+
+    def in_order(self, models):
+        return sorted(models, key=self.order.__getitem__)
+
+    def hit(self, x, y):
+        hits = self.query(x, y, x, y)
+        if not hits:
+            return None
+        return max(hits, key=self.order.__getitem__)
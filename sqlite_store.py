@@ -0,0 +1,244 @@
+import json
+import sqlite3
+
+from storage import DEFERRED_LAYERS, StorageWriter, load_layers
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS layers (
+    layer_id TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    view TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS elements (
+    element_id TEXT PRIMARY KEY,
+    layer_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS layers_by_file ON layers (file_id, position);
+CREATE INDEX IF NOT EXISTS elements_by_layer ON elements (layer_id, position);
+CREATE INDEX IF NOT EXISTS elements_by_file ON elements (file_id);
+"""
+
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    upgrade_schema(connection)
+    return connection
+
+
+def upgrade_schema(connection):
+    columns = {row[1] for row in connection.execute("PRAGMA table_info(layers)")}
+    if "view" not in columns:
+        connection.execute("ALTER TABLE layers ADD COLUMN view TEXT NOT NULL DEFAULT '{}'")
+
+
+def list_files(connection):
+    rows = connection.execute("SELECT file_id, file_name FROM files ORDER BY position")
+    return [{"file_id": file_id, "file_name": file_name} for file_id, file_name in rows]
+
+
+def load_file(connection, file_id):
+    row = connection.execute("SELECT file_name FROM files WHERE file_id = ?", (file_id,)).fetchone()
+    if row is None:
+        return None
+
+    layers = []
+    by_id = {}
+    for layer_id, name, view in connection.execute(
+            "SELECT layer_id, name, view FROM layers WHERE file_id = ? ORDER BY position", (file_id,)):
+        layer = by_id[layer_id] = {"id": layer_id, "name": name, "view": json.loads(view), "elements": []}
+        layers.append(layer)
+
+    for layer_id, data in connection.execute(
+            "SELECT layer_id, data FROM elements WHERE file_id = ? ORDER BY position", (file_id,)):
+        if layer_id in by_id:
+            by_id[layer_id]["elements"].append(json.loads(data))
+
+    return {"file_id": file_id, "file_name": row[0], "layers": layers}
+
+
+def load_seq(connection):
+    row = connection.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()
+    return int(row[0]) if row else 0
+
+
+class StoredFile:
+    # Stands in for a file's layers until the storyboard is first opened.
+    def __init__(self, db_path, file_id):
+        self.db_path = db_path
+        self.file_id = file_id
+
+    def load(self):
+        # Read-only and without the schema setup of connect(): the database was opened at startup.
+        connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            file = load_file(connection, self.file_id)
+        finally:
+            connection.close()
+        return file["layers"] if file is not None else []
+
+
+def load_state(connection, db_path):
+    files = [dict(file, **{DEFERRED_LAYERS: StoredFile(db_path, file["file_id"])}) for file in list_files(connection)]
+    return {"files": files, "journal_seq": load_seq(connection)}
+
+
+def insert_layer(connection, file_id, layer, position):
+    connection.execute("INSERT OR REPLACE INTO layers VALUES (?, ?, ?, ?, ?)",
+                       (layer["id"], file_id, layer["name"], position, json.dumps(layer.get("view", {}))))
+    connection.executemany("INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?, ?)",
+                           [(element["id"], layer["id"], file_id, index, json.dumps(element))
+                            for index, element in enumerate(layer["elements"])])
+
+
+def delete_file(connection, file_id):
+    connection.execute("DELETE FROM elements WHERE file_id = ?", (file_id,))
+    connection.execute("DELETE FROM layers WHERE file_id = ?", (file_id,))
+    connection.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+
+
+def insert_file(connection, file, position=None):
+    delete_file(connection, file["file_id"])
+    if position is None:
+        position = connection.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM files").fetchone()[0]
+    connection.execute("INSERT INTO files VALUES (?, ?, ?)", (file["file_id"], file["file_name"], position))
+    for index, layer in enumerate(load_layers(file)):
+        insert_layer(connection, file["file_id"], layer, index)
+
+
+def make_room(connection, table, owner_column, owner, index):
+    # Positions may have gaps after deletes, so find the row currently at the index.
+    row = None
+    if index is not None:
+        row = connection.execute(f"SELECT position FROM {table} WHERE {owner_column} = ? ORDER BY position "
+                                 "LIMIT 1 OFFSET ?", (owner, index)).fetchone()
+    if row is None:
+        return connection.execute(f"SELECT COALESCE(MAX(position), -1) + 1 FROM {table} WHERE {owner_column} = ?",
+                                  (owner,)).fetchone()[0]
+    connection.execute(f"UPDATE {table} SET position = position + 1 WHERE {owner_column} = ? AND position >= ?",
+                       (owner, row[0]))
+    return row[0]
+
+
+def apply_op(connection, op):
+    kind = op["op"]
+
+    if kind == "add_file":
+        insert_file(connection, op["data"])
+    elif kind == "delete_file":
+        delete_file(connection, op["file"])
+    elif kind == "rename_file":
+        connection.execute("UPDATE files SET file_name = ? WHERE file_id = ?", (op["name"], op["file"]))
+    elif kind == "add_layer":
+        position = make_room(connection, "layers", "file_id", op["file"], op["index"])
+        insert_layer(connection, op["file"], op["data"], position)
+    elif kind == "delete_layer":
+        connection.execute("DELETE FROM elements WHERE layer_id = ?", (op["layer"],))
+        connection.execute("DELETE FROM layers WHERE layer_id = ?", (op["layer"],))
+    elif kind == "rename_layer":
+        connection.execute("UPDATE layers SET name = ? WHERE layer_id = ?", (op["name"], op["layer"]))
+    elif kind == "set_layer_view":
+        connection.execute("UPDATE layers SET view = ? WHERE layer_id = ?", (json.dumps(op["view"]), op["layer"]))
+    elif kind == "add_element":
+        element = op["data"]
+        position = make_room(connection, "elements", "layer_id", op["layer"], op.get("index"))
+        connection.execute("INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?, ?)",
+                           (element["id"], op["layer"], op["file"], position, json.dumps(element)))
+    elif kind == "update_element":
+        row = connection.execute("SELECT data FROM elements WHERE element_id = ?", (op["element"],)).fetchone()
+        if row is not None:
+            element = json.loads(row[0])
+            element.update(op["data"])
+            connection.execute("UPDATE elements SET data = ? WHERE element_id = ?",
+                               (json.dumps(element), op["element"]))
+    elif kind == "delete_element":
+        connection.execute("DELETE FROM elements WHERE element_id = ?", (op["element"],))
+
+
+def migrate_app_state(connection, app_state):
+    with connection:
+        for file in app_state.get("files", []):
+            insert_file(connection, file)
+
+
+def load_sqlite_state(db_path="app_state.db", load_legacy=None):
+    connection = connect(db_path)
+    try:
+        is_empty = connection.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+        if is_empty and load_legacy is not None:
+            legacy_state = load_legacy()
+            if legacy_state and legacy_state.get("files"):
+                migrate_app_state(connection, legacy_state)
+        return load_state(connection, db_path)
+    finally:
+        connection.close()
+
+
+class SQLiteWriter(StorageWriter):
+    errors = (OSError, sqlite3.Error)
+
+    def __init__(self, db_path="app_state.db", seq=0):
+        super().__init__()
+        self.db_path = db_path
+        self.seq = seq
+        self.connection = None
+        self.start()
+
+    def setup(self):
+        self.connection = connect(self.db_path)
+
+    def teardown(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def append(self, ops):
+        if not ops:
+            return
+        if self.connection is None:
+            # Setup failed earlier; raising keeps the ops queued for the next retry.
+            self.connection = connect(self.db_path)
+        seq = self.seq + len(ops)
+        with self.connection:
+            for op in ops:
+                apply_op(self.connection, op)
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('seq', ?)", (str(seq),))
+        self.seq = seq
+
+    def store_snapshot(self, app_state):
+        if self.connection is None:
+            self.connection = connect(self.db_path)
+        files = app_state.get("files", [])
+        with self.connection:
+            file_ids = [file["file_id"] for file in files]
+            for (file_id,) in self.connection.execute("SELECT file_id FROM files").fetchall():
+                if file_id not in file_ids:
+                    delete_file(self.connection, file_id)
+            for position, file in enumerate(files):
+                if "layers" in file:
+                    insert_file(self.connection, file, position)
+                else:
+                    # Never opened, so nothing in memory can be newer than the database.
+                    self.connection.execute("UPDATE files SET file_name = ?, position = ? WHERE file_id = ?",
+                                            (file["file_name"], position, file["file_id"]))
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('seq', ?)", (str(self.seq),))
+
+    def compact_journal(self):
+        if self.connection is not None:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
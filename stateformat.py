@@ -0,0 +1,354 @@
+import array
+import functools
+import gc
+import itertools
+import json
+import os
+import pickle
+import struct
+import sys
+import zlib
+
+# Kouan state file (.kst), version 2
+#
+#   bytes 0-5     magic b"KOUAN\0"
+#   byte  6       format version (FORMAT_VERSION)
+#   byte  7       flags, currently always 0
+#   bytes 8-11    size of the head section in bytes, unsigned 32-bit little endian
+#   head          UTF-8 JSON document, described below
+#   segments      one segment per file, back to back, in file order
+#
+# The head is the app_state dict with every file's "layers" left out, plus a "segments" list
+# giving the byte size of each file's segment. Startup only parses the head; a file's segment
+# is decoded the first time the storyboard is needed, and untouched segments are copied
+# verbatim when the state is written again.
+#
+# A segment starts with a SEGMENT header (flags, then the sizes of its three sections before
+# compression). When bit 0 (FLAG_ZLIB) is set, the three sections that follow are zlib
+# compressed as one stream:
+#
+#   structure     UTF-8 JSON document {"layers": [...], "strings": [...]}
+#   columns       binary element columns, little endian, in the order the structure lists them
+#   text          every text string followed by a NUL character, as UTF-8
+#
+# Layers keep all of their keys, except that "elements" is replaced by column-oriented tables:
+#
+#   {"count": elements, "tables": [{"keys": [...], "count": rows, "columns": [column, ...]}]}
+#
+# Elements with exactly the same keys share a table, so rows carry no key names. Each column is
+# a one-letter kind, followed for "j" columns by the JSON values themselves:
+#
+#   "i"  signed 32-bit integers from the column section
+#   "d"  64-bit floats from the column section
+#   "s"  32-bit indices from the segment's "strings" list (INTERNED_FIELDS)
+#   "t"  strings taken in order from the text section
+#   "j"  any other JSON values, stored inline as ["j", [value per row]]
+#
+# A layer with more than one table is followed in the column section by a 32-bit table index
+# per element giving the element order. Sections are read in layer, table, column order.
+#
+# Version 1 files (one structure, column and text section for the whole state, with the head
+# sizes in bytes 8-15) are still read, fully decoded, and rewritten as version 2 on next save.
+
+MAGIC = b"KOUAN\0"
+FORMAT_VERSION = 2
+FLAG_ZLIB = 1
+PREFIX = struct.Struct("<6sBB")
+HEADER = struct.Struct("<6sBBI")
+HEADER_V1 = struct.Struct("<6sBBII")
+SEGMENT = struct.Struct("<BIII")
+
+COMPRESS = os.environ.get("KOUAN_COMPRESS", "1") not in ("", "0")
+# Same key storage.load_layers looks for; storage imports this module, not the other way round.
+DEFERRED_LAYERS = "deferred_layers"
+# Set by storage.read_layers on a file whose segment failed to decode; never written out.
+UNREADABLE = "unreadable"
+
+INTERNED_FIELDS = ("type", "color", "image_path")
+TEXT_SEPARATOR = "\0"
+INT_RANGE = range(-2 ** 31, 2 ** 31)
+ARRAY_TYPES = {"i": "i", "d": "d", "s": "I"}
+
+
+class FormatError(ValueError):
+    pass
+
+
+def pack_array(typecode, values):
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def column_kind(key, column):
+    types = set(map(type, column))
+    if types == {str}:
+        if key in INTERNED_FIELDS:
+            return "s"
+        if TEXT_SEPARATOR not in "".join(column):
+            return "t"
+    elif types == {int}:
+        if min(column) in INT_RANGE and max(column) in INT_RANGE:
+            return "i"
+    elif types == {float}:
+        return "d"
+    return "j"
+
+
+class Encoder:
+    def __init__(self):
+        self.strings = []
+        self.string_positions = {}
+        self.columns = []
+        self.texts = []
+
+    def intern(self, value):
+        position = self.string_positions.get(value)
+        if position is None:
+            position = self.string_positions[value] = len(self.strings)
+            self.strings.append(value)
+        return position
+
+    def encode_column(self, key, column):
+        kind = column_kind(key, column)
+        if kind == "s":
+            self.columns.append(pack_array("I", [self.intern(value) for value in column]))
+        elif kind in ("i", "d"):
+            self.columns.append(pack_array(kind, column))
+        elif kind == "t":
+            self.texts.extend(column)
+        else:
+            return [kind, column]
+        return kind
+
+    def encode_elements(self, elements):
+        tables = {}
+        order = []
+        for element in elements:
+            keys = tuple(element)
+            table = tables.get(keys)
+            if table is None:
+                table = tables[keys] = (len(tables), [])
+            order.append(table[0])
+            table[1].append(element)
+
+        encoded = []
+        for keys, (_, rows) in tables.items():
+            columns = [self.encode_column(key, [row[key] for row in rows]) for key in keys]
+            encoded.append({"keys": list(keys), "count": len(rows), "columns": columns})
+        if len(tables) > 1:
+            self.columns.append(pack_array("I", order))
+        return {"count": len(order), "tables": encoded}
+
+    def encode_layers(self, layers):
+        encoded_layers = []
+        for layer in layers:
+            encoded = {key: value for key, value in layer.items() if key != "elements"}
+            encoded["elements"] = self.encode_elements(layer.get("elements", []))
+            encoded_layers.append(encoded)
+        return encoded_layers
+
+
+def encode_segment(layers, compress):
+    encoder = Encoder()
+    document = {"layers": encoder.encode_layers(layers), "strings": encoder.strings}
+    structure = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    columns = b"".join(encoder.columns)
+    text = "".join(text + TEXT_SEPARATOR for text in encoder.texts).encode("utf-8")
+    body = b"".join((structure, columns, text))
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    return SEGMENT.pack(flags, len(structure), len(columns), len(text)) + body
+
+
+class Decoder:
+    def __init__(self, strings, columns, texts):
+        self.strings = strings
+        self.columns = columns
+        self.column_offset = 0
+        self.texts = texts
+
+    def read_array(self, typecode, count):
+        values = array.array(typecode)
+        end = self.column_offset + count * values.itemsize
+        if end > len(self.columns):
+            raise FormatError("column section is truncated")
+        values.frombytes(self.columns[self.column_offset:end])
+        self.column_offset = end
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tolist()
+
+    def decode_column(self, column, count):
+        if column == "t":
+            values = list(itertools.islice(self.texts, count))
+        elif type(column) is str and column in ARRAY_TYPES:
+            values = self.read_array(ARRAY_TYPES[column], count)
+            if column == "s":
+                values = list(map(self.strings.__getitem__, values))
+        elif type(column) is list and len(column) == 2 and column[0] == "j":
+            values = column[1]
+        else:
+            raise FormatError(f"unknown column kind {column!r}")
+        if len(values) != count:
+            raise FormatError(f"column length does not match row count {count}")
+        return values
+
+    def decode_elements(self, encoded):
+        tables = []
+        for table in encoded["tables"]:
+            count = table["count"]
+            if table["keys"]:
+                columns = [self.decode_column(column, count) for column in table["columns"]]
+                keys = table["keys"]
+                tables.append([dict(zip(keys, row)) for row in zip(*columns)])
+            else:
+                tables.append([{} for _ in range(count)])
+        if len(tables) == 1:
+            return tables[0]
+        order = self.read_array("I", encoded["count"])
+        tables = list(map(iter, tables))
+        return list(map(next, map(tables.__getitem__, order)))
+
+    def decode_layers(self, layers):
+        for layer in layers:
+            layer["elements"] = self.decode_elements(layer["elements"])
+        return layers
+
+
+def split_texts(text):
+    texts = str(text, "utf-8").split(TEXT_SEPARATOR)
+    if texts.pop():
+        raise FormatError("text section is not terminated")
+    return iter(texts)
+
+
+def decoding(function):
+    # The decoded state holds no reference cycles, so collection passes during the bulk
+    # allocation are pure overhead; every low-level failure surfaces as FormatError.
+    @functools.wraps(function)
+    def wrapper(*args):
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            return function(*args)
+        except FormatError:
+            raise
+        except (zlib.error, ValueError, KeyError, IndexError, TypeError, AttributeError, struct.error) as error:
+            raise FormatError(f"corrupt state file: {error}") from error
+        finally:
+            if collecting:
+                gc.enable()
+    return wrapper
+
+
+@decoding
+def decode_segment(segment):
+    flags, structure_size, columns_size, text_size = SEGMENT.unpack_from(segment)
+    body = segment[SEGMENT.size:]
+    if flags & FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+    columns_start = structure_size
+    text_start = columns_start + columns_size
+    if text_start + text_size != len(body):
+        raise FormatError("file segment is truncated")
+    document = json.loads(bytes(body[:columns_start]))
+    decoder = Decoder(document["strings"], body[columns_start:text_start], split_texts(body[text_start:]))
+    return decoder.decode_layers(document["layers"])
+
+
+class EncodedFile:
+    # A file's segment as read from disk, decoded by storage.load_layers on first use.
+    __slots__ = ("segment",)
+
+    def __init__(self, segment):
+        self.segment = segment
+
+    def load(self):
+        return decode_segment(self.segment)
+
+
+def dumps(app_state, compress=COMPRESS):
+    files = []
+    segments = []
+    for file in app_state.get("files", []):
+        source = file.get(DEFERRED_LAYERS)
+        if "layers" not in file and isinstance(source, EncodedFile):
+            # Never decoded, so never changed: the stored bytes are still exact.
+            segments.append(source.segment)
+        else:
+            layers = file["layers"] if "layers" in file else source.load() if source is not None else []
+            segments.append(encode_segment(layers, compress))
+        files.append({key: value for key, value in file.items() if key not in ("layers", DEFERRED_LAYERS, UNREADABLE)})
+
+    document = {key: value for key, value in app_state.items() if key != "files"}
+    document["files"] = files
+    document["segments"] = [len(segment) for segment in segments]
+    head = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return b"".join((HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(head)), head, *segments))
+
+
+def loads(data, lazy=True):
+    if len(data) < HEADER.size or data[:len(MAGIC)] != MAGIC:
+        raise FormatError("not a Kouan state file")
+    _, version, _ = PREFIX.unpack_from(data)
+    if version == 1:
+        return loads_v1(memoryview(data))
+    if version > FORMAT_VERSION:
+        raise FormatError(f"state file version {version} is newer than supported version {FORMAT_VERSION}")
+    return load_head(memoryview(data), lazy)
+
+
+@decoding
+def load_head(data, lazy):
+    _, _, _, head_size = HEADER.unpack_from(data)
+    offset = HEADER.size + head_size
+    document = json.loads(bytes(data[HEADER.size:offset]))
+    files = document.setdefault("files", [])
+    sizes = document.pop("segments")
+    if len(sizes) != len(files):
+        raise FormatError("file segments do not match the file list")
+    for file, size in zip(files, sizes):
+        segment = data[offset:offset + size]
+        if len(segment) != size or size < SEGMENT.size:
+            raise FormatError("state file is truncated")
+        offset += size
+        if lazy:
+            file[DEFERRED_LAYERS] = EncodedFile(segment)
+        else:
+            file["layers"] = decode_segment(segment)
+    return document
+
+
+@decoding
+def loads_v1(data):
+    _, _, flags, structure_size, columns_size = HEADER_V1.unpack_from(data)
+    columns_start = HEADER_V1.size + structure_size
+    text_start = columns_start + columns_size
+    if text_start > len(data):
+        raise FormatError("state file is truncated")
+    document = json.loads(bytes(data[HEADER_V1.size:columns_start]))
+    text = data[text_start:]
+    if flags & FLAG_ZLIB:
+        text = zlib.decompress(text)
+    decoder = Decoder(document.pop("strings", []), data[columns_start:text_start], split_texts(text))
+    for file in document.get("files", []):
+        decoder.decode_layers(file.get("layers", []))
+    return document
+
+
+class PlainDataUnpickler(pickle.Unpickler):
+    # Legacy snapshots only hold dicts, lists, strings and numbers, so no global is ever needed.
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"refusing to load {module}.{name} from a legacy state file")
+
+
+def load_legacy(file_path):
+    with open(file_path, "rb") as f:
+        try:
+            return PlainDataUnpickler(f).load()
+        except (EOFError, ValueError, pickle.UnpicklingError) as error:
+            raise FormatError(f"unreadable legacy state file: {error}") from error
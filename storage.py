@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+
+import stateformat
+
+STATE_PATH = "app_state.kst"
+LEGACY_STATE_PATH = "app_state.pkl"
+JOURNAL_PATH = "app_state.journal"
+RETRY_DELAY = 5
+DEFERRED_LAYERS = stateformat.DEFERRED_LAYERS
+UNREADABLE = stateformat.UNREADABLE
+
+logger = logging.getLogger(__name__)
+
+
+def write_atomic(file_path, data):
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+
+def load_snapshot(file_path):
+    try:
+        with open(file_path, "rb") as f:
+            return stateformat.loads(f.read())
+    except (OSError, stateformat.FormatError):
+        return None
+
+
+def read_journal(journal_path):
+    ops = []
+    valid_size = 0
+    try:
+        with open(journal_path, "rb") as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    # A torn write can only affect the tail of the journal.
+                    break
+                valid_size += len(line)
+    except OSError:
+        pass
+    return ops, valid_size
+
+
+def repair_journal(journal_path):
+    _, valid_size = read_journal(journal_path)
+    if os.path.exists(journal_path) and os.path.getsize(journal_path) != valid_size:
+        with open(journal_path, "r+b") as f:
+            f.truncate(valid_size)
+
+
+def assign_ids(app_state):
+    changed = False
+    for file in app_state.get("files", []):
+        if "file_id" not in file:
+            file["file_id"] = str(uuid.uuid4())
+            changed = True
+        for layer in file.get("layers", []):
+            if "id" not in layer:
+                layer["id"] = uuid.uuid4().hex
+                changed = True
+            for element in layer.get("elements", []):
+                if "id" not in element:
+                    element["id"] = uuid.uuid4().hex
+                    changed = True
+    return changed
+
+
+def load_layers(file):
+    # Lazily loaded files carry a DEFERRED_LAYERS source instead of "layers" until first needed.
+    if "layers" not in file:
+        layers = read_layers(file)
+        if UNREADABLE in file:
+            # The source stays, so the damaged bytes are written back as they are and never replaced.
+            return layers
+        file.pop(DEFERRED_LAYERS, None)
+        file["layers"] = layers
+    return file["layers"]
+
+
+def read_layers(file):
+    # For passes over every file: a deferred file is decoded for the caller but stays deferred.
+    if "layers" in file:
+        return file["layers"]
+    source = file.get(DEFERRED_LAYERS)
+    if source is None or UNREADABLE in file:
+        return []
+    try:
+        return source.load()
+    except stateformat.FormatError as error:
+        logger.error("storyboard %s cannot be read: %s", file.get("file_name"), error)
+        file[UNREADABLE] = str(error)
+        return []
+
+
+def copy_state(app_state):
+    # Copies every level the Tk thread mutates, so the writer thread can encode it at leisure.
+    state = dict(app_state)
+    state["files"] = [copy_file(file) for file in app_state.get("files", [])]
+    return state
+
+
+def copy_file(file):
+    file = dict(file)
+    if "layers" in file:
+        file["layers"] = [dict(layer, elements=[dict(element) for element in layer.get("elements", [])])
+                          for layer in file["layers"]]
+    return file
+
+
+def find_by_key(items, key, value):
+    return next((item for item in items if item.get(key) == value), None)
+
+
+def apply_op(app_state, op):
+    files = app_state["files"]
+    kind = op["op"]
+
+    if kind == "add_file":
+        app_state["files"] = [file for file in files if file["file_id"] != op["data"]["file_id"]]
+        app_state["files"].append(op["data"])
+        return
+    if kind == "delete_file":
+        app_state["files"] = [file for file in files if file["file_id"] != op["file"]]
+        return
+
+    file = find_by_key(files, "file_id", op["file"])
+    if file is None:
+        return
+    if kind == "rename_file":
+        file["file_name"] = op["name"]
+        return
+
+    layers = load_layers(file)
+    if kind == "add_layer":
+        if find_by_key(layers, "id", op["data"]["id"]) is None:
+            layers.insert(op["index"], op["data"])
+    elif kind == "delete_layer":
+        file["layers"] = [layer for layer in layers if layer["id"] != op["layer"]]
+    else:
+        layer = find_by_key(layers, "id", op["layer"])
+        if layer is None:
+            return
+        elements = layer["elements"]
+        if kind == "rename_layer":
+            layer["name"] = op["name"]
+        elif kind == "set_layer_view":
+            layer["view"] = op["view"]
+        elif kind == "add_element":
+            if find_by_key(elements, "id", op["data"]["id"]) is None:
+                elements.insert(op.get("index", len(elements)), op["data"])
+        elif kind == "update_element":
+            element = find_by_key(elements, "id", op["element"])
+            if element is not None:
+                element.update(op["data"])
+        elif kind == "delete_element":
+            layer["elements"] = [element for element in elements if element["id"] != op["element"]]
+
+
+def replay(app_state, ops):
+    seq = app_state.get("journal_seq", 0)
+    for op in ops:
+        if op["seq"] > seq:
+            apply_op(app_state, op)
+            seq = op["seq"]
+    app_state["journal_seq"] = seq
+    return app_state
+
+
+class StorageWriter(threading.Thread):
+    errors = (OSError,)
+
+    def __init__(self):
+        super().__init__(name="autosave", daemon=True)
+        self.queue = queue.Queue()
+        # ("error" | "snapshot" | "ok", message) for the Tk thread to show; "snapshot" asks it
+        # to hand over a copy of the in-memory state because retrying the ops failed too.
+        self.notices = queue.Queue()
+        self.seq = 0
+        self.failed = []
+        self.snapshot_requested = False
+
+    def record(self, ops):
+        if ops:
+            self.queue.put(("record", ops))
+
+    def compact(self):
+        self.queue.put(("compact", None))
+
+    def call(self, action):
+        # Runs on the writer thread once every previously recorded op has been written.
+        self.queue.put(("call", action))
+
+    def snapshot(self, app_state):
+        # The copy must be taken on the Tk thread: it already holds every op recorded before it.
+        self.queue.put(("snapshot", app_state))
+
+    def setup(self):
+        pass
+
+    def teardown(self):
+        pass
+
+    def run(self):
+        self.safely(self.setup)
+        running = True
+        while running:
+            try:
+                running = self.step()
+            except Exception:
+                # Never let the thread die: every later record() would be dropped unseen.
+                logger.exception("storage writer step failed")
+        self.safely(self.teardown)
+
+    def step(self):
+        try:
+            tasks = [self.queue.get(timeout=RETRY_DELAY if self.failed else None)]
+        except queue.Empty:
+            self.write([])
+            return True
+        while not self.queue.empty():
+            tasks.append(self.queue.get())
+
+        running = True
+        ops = []
+        for task, payload in tasks:
+            if task == "record":
+                ops.extend(payload)
+                continue
+            self.write(ops)
+            ops = []
+            if task == "compact":
+                self.safely(self.compact_journal)
+            elif task == "call":
+                self.safely(payload)
+            elif task == "snapshot":
+                self.write_snapshot(payload)
+            elif task == "close":
+                running = False
+        self.write(ops)
+        return running
+
+    def safely(self, action, *args):
+        try:
+            action(*args)
+        except self.errors:
+            pass
+        except Exception:
+            logger.exception("storage writer task failed")
+
+    def write(self, ops):
+        # Earlier failed ops go first so the journal keeps their order.
+        ops = self.failed + ops
+        if not ops:
+            return
+        try:
+            self.append(ops)
+        except Exception as error:
+            if not isinstance(error, self.errors):
+                logger.exception("writing %d ops failed", len(ops))
+            retried = bool(self.failed)
+            self.failed = ops
+            if retried and not self.snapshot_requested:
+                self.snapshot_requested = True
+                self.notices.put(("snapshot", str(error)))
+            else:
+                self.notices.put(("error", str(error)))
+            return
+        if self.failed:
+            self.notices.put(("ok", None))
+        self.failed = []
+        self.snapshot_requested = False
+
+    def write_snapshot(self, app_state):
+        try:
+            self.store_snapshot(app_state)
+        except Exception as error:
+            if not isinstance(error, self.errors):
+                logger.exception("writing a full snapshot failed")
+            self.snapshot_requested = False
+            self.notices.put(("error", str(error)))
+            return
+        # The snapshot already contains every op that could not be journaled.
+        self.failed = []
+        self.snapshot_requested = False
+        self.notices.put(("ok", None))
+
+    def append(self, ops):
+        raise NotImplementedError
+
+    def store_snapshot(self, app_state):
+        raise NotImplementedError
+
+    def compact_journal(self):
+        pass
+
+    def close(self):
+        if self.is_alive():
+            self.queue.put(("close", None))
+            self.join()
+
+
+class AutosaveWriter(StorageWriter):
+    def __init__(self, file_path=STATE_PATH, journal_path=JOURNAL_PATH, seq=0,
+                 compact_threshold=512 * 1024):
+        super().__init__()
+        self.file_path = file_path
+        self.journal_path = journal_path
+        self.seq = seq
+        self.compact_threshold = compact_threshold
+        repair_journal(journal_path)
+        self.start()
+
+    def append(self, ops):
+        if not ops:
+            return
+
+        seq = self.seq
+        lines = []
+        for op in ops:
+            seq += 1
+            lines.append(json.dumps(dict(op, seq=seq)) + "\n")
+
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            start = f.tell()
+            try:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # A torn line would hide everything written after it, so drop the partial batch.
+                try:
+                    f.truncate(start)
+                except OSError:
+                    pass
+                raise
+            size = f.tell()
+        # Only durable ops use up sequence numbers; a failed batch is retried with the same ones.
+        self.seq = seq
+
+        if size > self.compact_threshold:
+            self.safely(self.compact_journal)
+
+    def store_snapshot(self, app_state):
+        app_state["journal_seq"] = self.seq
+        write_atomic(self.file_path, stateformat.dumps(app_state))
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact_journal(self):
+        ops, _ = read_journal(self.journal_path)
+        if not ops:
+            return
+        app_state = load_snapshot(self.file_path) or {"files": []}
+        replay(app_state, ops)
+        write_atomic(self.file_path, stateformat.dumps(app_state))
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
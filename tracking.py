@@ -0,0 +1,163 @@
+class ChangeTracker:
+    def __init__(self, widget, flush, delay=300):
+        self.widget = widget
+        self.flush_callback = flush
+        self.delay = delay
+
+        self.dirty = False
+        self.dirty_layers = set()
+        self.dirty_elements = set()
+        self._pending = None
+
+        self.recorded = False
+        self.file_name = None
+        self.layer_dicts = {}
+        self.element_dicts = {}
+
+    def prime(self, file_data):
+        self.recorded = True
+        self.file_name = file_data.get("file_name")
+        for layer_data in file_data.get("layers", []):
+            self.layer_dicts[layer_data["id"]] = layer_data
+            for element_data in layer_data["elements"]:
+                self.element_dicts[element_data["id"]] = element_data
+
+    def mark(self, layer=None, element=None):
+        self.dirty = True
+        if layer is not None:
+            self.dirty_layers.add(layer)
+        if element is not None:
+            self.dirty_elements.add(element)
+        self.schedule()
+
+    def discard(self, element):
+        self.dirty_elements.discard(element)
+
+    def schedule(self):
+        if self._pending is None:
+            self._pending = self.widget.after(self.delay, self._on_timer)
+
+    def cancel(self):
+        if self._pending is not None:
+            self.widget.after_cancel(self._pending)
+            self._pending = None
+
+    def _on_timer(self):
+        self._pending = self.widget.after_idle(self._on_idle)
+
+    def _on_idle(self):
+        self._pending = None
+        self.flush()
+
+    def flush(self):
+        if self.dirty:
+            self.flush_callback()
+        else:
+            self.cancel()
+
+    def collect(self, file_model):
+        self.cancel()
+        file_id = file_model.file_id
+        ops = []
+        undo = []
+
+        if self.recorded and self.file_name != file_model.file_name:
+            ops.append({"op": "rename_file", "file": file_id, "name": file_model.file_name})
+
+        # Deletions go first so that positional inserts below line up with the final order.
+        layer_ids = {layer.id for layer in file_model.layers}
+        restores = []
+        for index, (layer_id, previous) in enumerate(list(self.layer_dicts.items())):
+            if layer_id in layer_ids:
+                continue
+            del self.layer_dicts[layer_id]
+            for element_data in previous["elements"]:
+                self.element_dicts.pop(element_data["id"], None)
+            if self.recorded:
+                ops.append({"op": "delete_layer", "file": file_id, "layer": layer_id})
+                restores.append({"op": "add_layer", "file": file_id, "index": index, "data": previous})
+
+        layer_dicts = {}
+        for index, layer in enumerate(file_model.layers):
+            previous = self.layer_dicts.get(layer.id)
+            if previous is not None and layer not in self.dirty_layers:
+                layer_dicts[layer.id] = previous
+                continue
+
+            elements = []
+            for element in layer.elements:
+                data = self.element_dicts.get(element.id)
+                if data is None or element in self.dirty_elements:
+                    data = self.element_dicts[element.id] = element.to_dict()
+                elements.append(data)
+
+            data = layer_dicts[layer.id] = {"id": layer.id, "name": layer.name, "view": layer.view_dict(),
+                                            "elements": elements}
+            if self.recorded:
+                layer_ops, layer_undo = self.layer_ops(file_id, index, previous, data)
+                ops.extend(layer_ops)
+                undo[:0] = layer_undo
+        self.layer_dicts = layer_dicts
+        undo.extend(restores)
+
+        self.dirty = False
+        self.dirty_layers.clear()
+        self.dirty_elements.clear()
+
+        file_data = {
+            "file_id": file_id,
+            "file_name": file_model.file_name,
+            "layers": list(layer_dicts.values())
+        }
+        if not self.recorded:
+            ops.append({"op": "add_file", "data": file_data})
+            self.recorded = True
+        self.file_name = file_model.file_name
+
+        return file_data, ops, undo
+
+    def layer_ops(self, file_id, index, previous, data):
+        layer_id = data["id"]
+        if previous is None:
+            return ([{"op": "add_layer", "file": file_id, "index": index, "data": data}],
+                    [{"op": "delete_layer", "file": file_id, "layer": layer_id}])
+
+        ops = []
+        undo = []
+        if previous["name"] != data["name"]:
+            ops.append({"op": "rename_layer", "file": file_id, "layer": layer_id, "name": data["name"]})
+            undo.append({"op": "rename_layer", "file": file_id, "layer": layer_id, "name": previous["name"]})
+        if previous.get("view") != data["view"]:
+            ops.append({"op": "set_layer_view", "file": file_id, "layer": layer_id, "view": data["view"]})
+
+        element_ids = {element["id"] for element in data["elements"]}
+        previous_elements = {}
+        restores = []
+        for position, element in enumerate(previous["elements"]):
+            if element["id"] in element_ids:
+                previous_elements[element["id"]] = element
+                continue
+            self.element_dicts.pop(element["id"], None)
+            ops.append({"op": "delete_element", "file": file_id, "layer": layer_id, "element": element["id"]})
+            restores.append({"op": "add_element", "file": file_id, "layer": layer_id, "index": position,
+                             "data": element})
+
+        changes_undo = []
+        for position, element in enumerate(data["elements"]):
+            old = previous_elements.get(element["id"])
+            if old is None:
+                ops.append({"op": "add_element", "file": file_id, "layer": layer_id, "index": position,
+                            "data": element})
+                changes_undo.append({"op": "delete_element", "file": file_id, "layer": layer_id,
+                                     "element": element["id"]})
+            elif old is not element:
+                changes = {key: value for key, value in element.items() if old.get(key) != value}
+                if changes:
+                    ops.append({"op": "update_element", "file": file_id, "layer": layer_id,
+                                "element": element["id"], "data": changes})
+                    changes_undo.append({"op": "update_element", "file": file_id, "layer": layer_id,
+                                         "element": element["id"],
+                                         "data": {key: old[key] for key in changes if key in old}})
+
+        changes_undo.reverse()
+        return ops, changes_undo + restores + undo